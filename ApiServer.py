@@ -0,0 +1,277 @@
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from BatchInput import estimate_recipe, init_worker, parse_amount
+import backend.Feasibility as Feasibility
+import backend.Input as Input
+import backend.recipe.createRecipe as createRecipe
+
+# Lightweight JSON API for the estimation pipeline, so concurrent users do not each pin a core
+# inside the flet UI process:
+#
+#   python ApiServer.py --port 8080 --workers 8
+#
+#   POST /estimate {"ingredients": ["Basil", "Oil", "Salt"], "amounts": [40, null, 1.5], "nutrients": {"salt": 1.5}}
+#   POST /recipe   {"name": "Pesto", "ingredients": ["Basil", "Oil", "Salt"], "mean": [0.4, 0.585, 0.015]}
+#   GET  /health
+#
+# Amounts are in % like in the web input. Jobs wait in a bounded queue in front of a fixed-size
+# process pool: a full queue is answered with 503 (backpressure), a job that is not done within
+# the timeout with 504, and its sampler is stopped in the worker through the cancel event.
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Deadline:
+    # picklable stand-in for the cancel event of the sampler, set once the job ran out of time
+    def __init__(self, seconds):
+        self.deadline = time.time() + seconds
+
+
+    def is_set(self):
+        return time.time() > self.deadline
+
+
+def generate_recipes(jobs):
+    # jobs are (name, ingredients, mean), all of them are generated in one batch.
+    # the model (and transformers) is loaded by the first request
+    prompts = [createRecipe.createPrompt(name, ingredients, mean) for name, ingredients, mean in jobs]
+    return [{"recipe": recipe} for recipe in createRecipe.get_model().getRecipes(prompts)]
+
+
+class EstimationServer:
+    def __init__(self, workers=4, queue_size=64, timeout=60.0):
+        self.workers = workers
+        self.timeout = timeout
+        self.estimate_queue = asyncio.Queue(maxsize=queue_size)
+        self.recipe_queue = asyncio.Queue(maxsize=queue_size)
+        # forked workers would inherit the sockets of open connections and keep them from closing
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=init_worker)
+        # the recipe model is not picklable and too large to load per process, it runs in one thread
+        self.recipe_pool = ThreadPoolExecutor(max_workers=1)
+        self.tasks = []
+        self.server = None
+
+
+    async def start(self, host="127.0.0.1", port=8080):
+        # start the worker processes up front, so the first requests do not pay for it
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.pool, init_worker) for _ in range(self.workers)))
+
+        # one consumer per worker process, so jobs never queue up inside the pool itself
+        self.tasks = [asyncio.create_task(self.consume(self.estimate_queue, self.pool)) for _ in range(self.workers)]
+        self.tasks.append(asyncio.create_task(self.consume_recipes()))
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.server
+
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.pool.shutdown(wait=False)
+        self.recipe_pool.shutdown(wait=False)
+
+
+    async def consume(self, queue, executor):
+        loop = asyncio.get_running_loop()
+        while True:
+            function, args, future = await queue.get()
+            try:
+                # the client may already have timed out while the job was waiting
+                if not future.done():
+                    result = await loop.run_in_executor(executor, function, *args)
+                    if not future.done():
+                        future.set_result(result)
+            except Exception as error:
+                if not future.done():
+                    future.set_exception(error)
+            finally:
+                queue.task_done()
+
+
+    async def consume_recipes(self):
+        # takes every recipe request that is waiting (up to a batch) and generates them together
+        loop = asyncio.get_running_loop()
+        while True:
+            jobs = [await self.recipe_queue.get()]
+            while len(jobs) < createRecipe.BATCH_SIZE and not self.recipe_queue.empty():
+                jobs.append(self.recipe_queue.get_nowait())
+            # the clients may already have timed out while the jobs were waiting
+            waiting = [job for job in jobs if not job[2].done()]
+            try:
+                if waiting:
+                    results = await loop.run_in_executor(self.recipe_pool, generate_recipes, [args for _, args, _ in waiting])
+                    for (_, _, future), result in zip(waiting, results):
+                        if not future.done():
+                            future.set_result(result)
+            except Exception as error:
+                for _, _, future in waiting:
+                    if not future.done():
+                        future.set_exception(error)
+            finally:
+                for _ in jobs:
+                    self.recipe_queue.task_done()
+
+
+    async def submit(self, queue, function, *args):
+        future = asyncio.get_running_loop().create_future()
+        try:
+            queue.put_nowait((function, args, future))
+        except asyncio.QueueFull:
+            raise HttpError(503, "server is busy, please retry later")
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            raise HttpError(504, f"job did not finish within {self.timeout:g} seconds")
+
+
+    async def route(self, method, path, body):
+        if method == "GET" and path == "/health":
+            return {"status": "ok", "queued": self.estimate_queue.qsize(), "queued_recipes": self.recipe_queue.qsize()}
+
+        if method == "POST" and path == "/estimate":
+            names = body.get("ingredients")
+            if not isinstance(names, list) or not names:
+                raise HttpError(400, "'ingredients' must be a non-empty list")
+            amounts = body.get("amounts", [None] * len(names))
+            if not isinstance(amounts, list) or len(amounts) != len(names):
+                raise HttpError(400, "'ingredients' and 'amounts' must be lists of the same length")
+            declared = body.get("nutrients", {})
+            if not isinstance(declared, dict):
+                raise HttpError(400, "'nutrients' must be an object of nutrient names and values")
+            try:
+                feasibility = Feasibility.check(names, [parse_amount(amount) for amount in amounts])
+            except (TypeError, ValueError):
+                raise HttpError(400, "'ingredients' must be names and 'amounts' numbers or null")
+            # labels that can not be estimated are answered right away, without taking a slot in the pool
+            if not feasibility:
+                raise HttpError(422, feasibility.message)
+            nutrients = [declared.get(column) for column in Input.NUTRIENTS]
+            result = await self.submit(self.estimate_queue, estimate_recipe, 0, body.get("name", ""), list(zip(names, amounts)), nutrients, Deadline(self.timeout))
+            if result["error"] is not None:
+                raise HttpError(422, result["error"])
+            del result["index"], result["error"]
+            return result
+
+        if method == "POST" and path == "/recipe":
+            names = body.get("ingredients")
+            mean = body.get("mean")
+            if not isinstance(names, list) or not isinstance(mean, list) or len(mean) != len(names):
+                raise HttpError(400, "'ingredients' and 'mean' must be lists of the same length")
+            return await self.submit(self.recipe_queue, generate_recipes, body.get("name", ""), names, mean)
+
+        raise HttpError(404, f"no route for {method} {path}")
+
+
+    async def handle_connection(self, reader, writer):
+        status, response = 200, None
+        try:
+            method, path, body = await read_request(reader)
+            response = await self.route(method, path, body)
+        except HttpError as error:
+            status, response = error.status, {"error": error.message}
+        except Exception:
+            logger.exception("request failed")
+            status, response = 500, {"error": "internal server error"}
+        try:
+            await write_response(writer, status, response)
+        finally:
+            writer.close()
+
+
+async def read_request(reader):
+    request_line = await reader.readline()
+    try:
+        method, target, _ = request_line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HttpError(400, "malformed request line")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get("content-length", 0) or 0)
+    if length > MAX_BODY_BYTES:
+        raise HttpError(413, "request body too large")
+    body = {}
+    if length:
+        try:
+            body = json.loads(await reader.readexactly(length))
+        except ValueError:
+            raise HttpError(400, "request body is not valid JSON")
+        if not isinstance(body, dict):
+            raise HttpError(400, "request body must be a JSON object")
+    return method, target.split("?", 1)[0], body
+
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large", 422: "Unprocessable Entity",
+           500: "Internal Server Error", 503: "Service Unavailable", 504: "Gateway Timeout"}
+
+
+async def write_response(writer, status, response):
+    payload = json.dumps(response).encode("utf-8")
+    headers = [
+        f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+        "Content-Type: application/json",
+        f"Content-Length: {len(payload)}",
+        "Connection: close",
+    ]
+    if status == 503:
+        headers.append("Retry-After: 1")
+    writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + payload)
+    await writer.drain()
+
+
+async def serve(host, port, workers, queue_size, timeout):
+    server = EstimationServer(workers=workers, queue_size=queue_size, timeout=timeout)
+    await server.start(host, port)
+    logger.info(f"serving on http://{host}:{port} with {workers} workers")
+    try:
+        await asyncio.Event().wait()  # run until interrupted
+    finally:
+        await server.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="JSON API for estimating ingredient amounts.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=4, help="size of the process pool")
+    parser.add_argument("--queue-size", type=int, default=64, help="jobs waiting before requests get 503")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds per job before requests get 504")
+    parser.add_argument("--recipe-backend", choices=createRecipe.BACKENDS, default=createRecipe.BACKEND, help="inference backend of the recipe model")
+    parser.add_argument("--recipe-model-path", default=createRecipe.MODEL_PATH, help="local directory of the recipe model (no download)")
+    args = parser.parse_args(argv)
+    createRecipe.BACKEND = args.recipe_backend
+    createRecipe.MODEL_PATH = args.recipe_model_path
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.queue_size, args.timeout))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
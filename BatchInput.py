@@ -0,0 +1,189 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+import backend.Input as Input
+import data.DataManager as DataManager
+import data.NutrientDatabase as NutrientDatabase
+
+# Headless batch estimation of many labels, e.g. a whole product catalogue:
+#
+#   python BatchInput.py recipes.csv results.jsonl --workers 16
+#
+# Input is either a CSV in the layout of data/ingredients.csv (numbered ingredient columns "1", "2", ...,
+# the nutrient columns and "recipe") or a JSONL file with one recipe per line:
+#   {"recipe": "Pesto", "ingredients": [{"name": "Basil", "amount": 40}, {"name": "Oil"}], "nutrients": {"salt": 1.2}}
+# Ingredient cells in the CSV are "name" or "name:amount". Amounts and nutrients are in % (g per 100 g)
+# like in the web input, missing amounts are estimated. Declared nutrients constrain the estimate through
+# the ingredient profiles of data/NutrientDatabase.py. Results are written as soon as they are done, as JSONL
+# (one line per recipe) or as CSV (one line per ingredient) depending on the extension of the output file.
+# The estimates are also added to the history of data/DataManager.py, HISTORY_BATCH of them per transaction.
+
+HISTORY_BATCH = 100
+
+
+def parse_amount(value):
+    if value is None or str(value).strip() == "":
+        return None
+    return float(str(value).strip()) / 100
+
+
+def split_ingredient(cell):
+    # "Sugar:45" -> ("Sugar", "45"), "Sugar" -> ("Sugar", ""), the amount is parsed by the worker
+    name, _, amount = str(cell).partition(":")
+    return name.strip(), amount
+
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8") as file:
+        for row in csv.DictReader(file):
+            columns = sorted((column for column in row if column and column.isdigit()), key=int)
+            cells = [row[column] for column in columns if row[column] not in (None, "")]
+            ingredients = [split_ingredient(cell) for cell in cells]
+            nutrients = [row.get(column) for column in Input.NUTRIENTS]
+            yield row.get("recipe", ""), ingredients, nutrients
+
+
+def read_jsonl(path):
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            recipe = json.loads(line)
+            ingredients = []
+            for item in recipe["ingredients"]:
+                if isinstance(item, dict):
+                    ingredients.append((item["name"], item.get("amount")))
+                else:
+                    ingredients.append(split_ingredient(item))
+            declared = recipe.get("nutrients", {})
+            nutrients = [declared.get(column) for column in Input.NUTRIENTS]
+            yield recipe.get("recipe", ""), ingredients, nutrients
+
+
+def read_recipes(path):
+    return read_jsonl(path) if str(path).endswith(".jsonl") else read_csv(path)
+
+
+def init_worker():
+    # forked workers inherit the random state of the parent, without a fresh seed all would draw the same chains
+    np.random.seed()
+    # loaded once per worker (forked workers already share the one of the parent)
+    NutrientDatabase.load_database()
+
+
+def estimate_recipe(index, recipe, ingredients, nutrients, cancel=None):
+    # runs in a worker process, errors are reported in the result instead of stopping the batch
+    result = {"index": index, "recipe": recipe}
+    try:
+        names = [name for name, _ in ingredients]
+        amounts = [parse_amount(amount) for _, amount in ingredients]
+        nutrients = [parse_amount(value) for value in nutrients]
+        table = NutrientDatabase.nutrient_table(names) if any(value is not None for value in nutrients) else None
+        result.update(Input.estimate(names, amounts, nutrients, table, cancel=cancel))
+        result["error"] = None
+    except Exception as error:
+        result["ingredients"] = [name for name, _ in ingredients]
+        result["error"] = "".join(traceback.format_exception_only(type(error), error)).strip()
+    return result
+
+
+def history_entry(result, ingredients, nutrients):
+    # a finished estimate as saved by DataManager.save_many, in fractions like the samples
+    item = DataManager.entry(
+        result["ingredients"],
+        [parse_amount(value) for value in nutrients],
+        result["recipe"],
+        [parse_amount(amount) for _, amount in ingredients],
+    )
+    item.update(mean=result["mean"], std=[value / 2 for value in result["two_sigma"]], num_samples=result["num_samples"])
+    return item
+
+
+class ResultWriter:
+    def __init__(self, file, as_csv):
+        self.file = file
+        self.csv = csv.writer(file) if as_csv else None
+        if self.csv is not None:
+            self.csv.writerow(["index", "recipe", "ingredient", "mean", "two_sigma", "num_samples", "seconds", "error"])
+
+
+    def write(self, result):
+        if self.csv is None:
+            self.file.write(json.dumps(result) + "\n")
+        elif result["error"] is not None:
+            self.csv.writerow([result["index"], result["recipe"], "", "", "", "", "", result["error"]])
+        else:
+            for name, mean, two_sigma in zip(result["ingredients"], result["mean"], result["two_sigma"]):
+                self.csv.writerow([result["index"], result["recipe"], name, mean, two_sigma, result["num_samples"], result["seconds"], ""])
+        # flush every result, so a crash overnight does not lose the finished ones
+        self.file.flush()
+
+
+def run_batch(input_path, output_path, workers=None, max_pending=None, history_path=DataManager.DATABASE_PATH):
+    # history_path=None does not save the estimates to the history
+    recipes = enumerate(read_recipes(input_path))
+    done_count = failed_count = 0
+    history = []
+
+    workers = workers or os.cpu_count() or 1
+    # only keep a few recipes per worker in flight, so huge inputs are never read into memory at once
+    max_pending = max_pending or 4 * workers
+    NutrientDatabase.load_database()
+
+    with open(output_path, "w", newline="", encoding="utf-8") as file, ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        writer = ResultWriter(file, as_csv=str(output_path).endswith(".csv"))
+        pending = {}  # future -> (ingredients, nutrients) for the history
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < max_pending:
+                try:
+                    index, (recipe, ingredients, nutrients) = next(recipes)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[pool.submit(estimate_recipe, index, recipe, ingredients, nutrients)] = (ingredients, nutrients)
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                ingredients, nutrients = pending.pop(future)
+                result = future.result()
+                writer.write(result)
+                done_count += 1
+                failed_count += result["error"] is not None
+                if result["error"] is None:
+                    history.append(history_entry(result, ingredients, nutrients))
+
+            if history_path is not None and len(history) >= HISTORY_BATCH:
+                DataManager.save_many(history, history_path)
+                history = []
+
+        if history_path is not None and history:
+            DataManager.save_many(history, history_path)
+
+    return done_count, failed_count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estimate the ingredient amounts of many labels at once.")
+    parser.add_argument("input", help="CSV in the layout of data/ingredients.csv or JSONL with one recipe per line")
+    parser.add_argument("output", help="results, .jsonl (one line per recipe) or .csv (one line per ingredient)")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: all cores)")
+    parser.add_argument("--history", default=DataManager.DATABASE_PATH, help="SQLite history the estimates are added to")
+    parser.add_argument("--no-history", action="store_true", help="do not add the estimates to the history")
+    args = parser.parse_args(argv)
+
+    history_path = None if args.no_history else args.history
+    done_count, failed_count = run_batch(args.input, args.output, workers=args.workers, history_path=history_path)
+    print(f"{done_count} recipes estimated, {failed_count} failed", file=sys.stderr)
+    return 1 if failed_count else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,19 @@
 import flet as ft
+import logging
 import numpy as np
-from flet.matplotlib_chart import MatplotlibChart
 import os
+import sqlite3
+import threading
+from contextlib import closing
+import backend.Feasibility as Feasibility
 import backend.Input as Input
+import backend.MainCode as MainCode
 import backend.recipe.createRecipe as createRecipe
+import data.DataManager as DataManager
+import data.ResultCache as ResultCache
+
+logger = logging.getLogger(__name__)
 
-import matplotlib
-import matplotlib.pyplot as plt
- 
-matplotlib.use("svg")
 tutorial_shown = False
 
 
@@ -87,15 +92,73 @@ class TutorialWindow:
         self.page.dialog.open = True
         self.page.update()
 
+# flet adapter for the progress callable of the sampler in backend/MainCode.py
+class LoadingBar:
+    def __init__(self, page):
+        self.page = page
+        self.bar = ft.ProgressBar(value=0)
+
+
+    def __enter__(self):
+        self.page.add(self.bar)
+        return self
+
+
+    def __exit__(self, *exc_info):
+        if self.bar in self.page.controls:
+            self.page.remove(self.bar)
+
+
+    def __call__(self, value):
+        # only the bar is sent to the browser, not the whole page
+        self.bar.value = value
+        self.bar.update()
+
+
+# results table that stays the same control between computations: a new result only changes
+# the values of the cells and adds or drops rows, so flet only sends the changed cells
+class ResultsView:
+    def __init__(self, text_size=15):
+        self.text_size = text_size
+        self.title = ft.Text("", theme_style=ft.TextThemeStyle.TITLE_MEDIUM)
+        self.table = ft.DataTable(
+            columns=[
+                ft.DataColumn(ft.Text("Ingredient", size=text_size, weight=ft.FontWeight.BOLD)),
+                ft.DataColumn(ft.Text("Amount", size=text_size, weight=ft.FontWeight.BOLD)),
+                ft.DataColumn(ft.Text("Percentage", size=text_size, weight=ft.FontWeight.BOLD)),
+                ft.DataColumn(ft.Text("Deviation", size=text_size, weight=ft.FontWeight.BOLD)),
+            ],
+            rows=[],
+        )
+        self.control = ft.Column([
+                ft.Container(content=self.title, alignment=ft.alignment.center),
+                ft.Container(content=self.table, alignment=ft.alignment.center),
+            ],)
+
+
+    def set_values(self, title, rows):
+        # rows: one tuple of the four cell texts per ingredient
+        self.title.value = title
+        while len(self.table.rows) < len(rows):
+            self.table.rows.append(ft.DataRow(cells=[ft.DataCell(ft.Text("", size=self.text_size)) for _ in range(4)]))
+        del self.table.rows[len(rows):]
+        for row, values in zip(self.table.rows, rows):
+            for cell, value in zip(row.cells, values):
+                cell.content.value = value
+
+
 class MainPage:
     def __init__(self, page):
         self.page = page
         self.path = os.path.dirname(os.path.realpath(__file__))
         self.text_elements = None
+        self.results = ResultsView()
         self.input_rows = []
         self.plot = None
+        self.plot_panel = None
+        self.plot_key = None
         self.computing = False
-        self.model = createRecipe.Model()
+        self.cancel_event = None
         self.name = None
         self.ingredients = []
         self.mean_sample = None
@@ -107,7 +170,7 @@ class MainPage:
     def add_row(self, e):
 
         if (self.plot is not None) or (self.text_elements is not None) or (self.ai_output is not None):
-            self.remove_all_output(e)
+            self.remove_all_output(e, update=False)
 
         name_input = ft.TextField(
             label="Ingredient Name",
@@ -152,9 +215,10 @@ class MainPage:
     def delete_row(self, e):
         
         if (self.plot is not None) or (self.text_elements is not None) or (self.ai_output is not None):
-            self.remove_all_output(e)
+            self.remove_all_output(e, update=False)
         if len(self.input_rows) > 0:
-            self.page.remove(self.input_rows.pop())
+            self.page.controls.remove(self.input_rows.pop())
+        self.page.update()
 
 
     def get_inputs(self):
@@ -169,109 +233,33 @@ class MainPage:
  # Function to show the plot
  
     def compute_plot(self):
-        color = "white" if self.page.theme_mode == "dark" else "black"
-        
         mean_sample = np.mean(self.SAMPLES, axis=0)
         std_sample = np.std(self.SAMPLES, axis=0)
-        
-        fig, ax = plt.subplots()
-        
-        fig.patch.set_facecolor('none')
-        ax.set_facecolor('none')
-        
-        ax.bar(self.ingredients, mean_sample * 100, align='center', color='#0b105c', alpha=0.7, ecolor='none', capsize=10)
-        ax.errorbar(self.ingredients, mean_sample * 100, yerr=std_sample * 100, fmt='none', ecolor='#FF5722', capsize=5)
-
 
-        ax.set_ylabel('Proportion of Ingredients', color=color)
-        ax.set_title('Mean and Standard Deviation of Ingredients in the Recipe', color=color)
-        # Set axis ticks and labels to white
-        ax.tick_params(axis='x', colors=color)
-        ax.tick_params(axis='y', colors=color)
-        ax.yaxis.label.set_color(color)
-        ax.xaxis.label.set_color(color)
-        
-        
-        ax.legend(["Mean", "Standard Deviation"], loc='upper right', facecolor='#333333', edgecolor='none', labelcolor=color)
-        ax.set_ylim(0,100) 
-    
-        
-        chart_container = ft.Container(
-            content=MatplotlibChart(fig, expand=True),
-            width=600,  
-            height=400
+        # the chart only depends on the result, showing the same result again reuses the controls
+        key = (tuple(self.ingredients), mean_sample.tobytes(), std_sample.tobytes())
+        if self.plot_key != key:
+            self.plot_panel = ft.ExpansionPanelList(
+                expand_icon_color=ft.colors.BLUE,
+                elevation=8,
+                controls=[
+                    ft.ExpansionPanel(
+                        header=ft.ListTile(title=ft.Text("Plot of the Recipe")),
+                        content=ft.Container(content=bar_chart(self.ingredients, mean_sample, std_sample), width=600, height=400, padding=ft.padding.all(20)),
+                    )
+                ]
             )
-        
-        panel = ft.ExpansionPanelList(
-            expand_icon_color=ft.colors.BLUE,
-            elevation=8,
-            controls=[
-                ft.ExpansionPanel(
-                    header=ft.ListTile(title=ft.Text("Plot of the Recipe")),
-                    content=chart_container,
-                )
-            ]
-        )        
-        self.plot = panel
+            self.plot_key = key
+
+        self.plot = self.plot_panel
         self.page.add(self.plot)
-        
-        
-        # oder boxplot
-        # color = "white" if self.page.theme_mode == "dark" else "black"
-        
-        # fig, ax = plt.subplots()
-        
-        # fig.patch.set_facecolor('none')
-        # ax.set_facecolor('none')
-
-        # # Create boxplots
-        # box = ax.boxplot(SAMPLES * 100, patch_artist=True,
-        #                  boxprops=dict(facecolor='#0b105c', color=color),
-        #                  capprops=dict(color=color),
-        #                  whiskerprops=dict(color=color),
-        #                  flierprops=dict(markeredgecolor=color),
-        #                  medianprops=dict(color='#FF5722'))
-
-        # # Set labels and title
-        # ax.set_xticks(np.arange(1, len(ingredients) + 1))
-        # ax.set_xticklabels(ingredients, rotation=45, ha="right", color=color)
-        # ax.set_ylabel('Proportion of Ingredients', color=color)
-        # ax.set_title('Boxplots of Ingredients in the Recipe', color=color)
-
-        # # Set axis ticks and labels to the appropriate color
-        # ax.tick_params(axis='x', colors=color)
-        # ax.tick_params(axis='y', colors=color)
-        # ax.yaxis.label.set_color(color)
-        # ax.xaxis.label.set_color(color)
-
-        # ax.set_ylim(0, 100)
-
-        # chart_container = ft.Container(
-        #     content=MatplotlibChart(fig, expand=True),
-        #     width=600,  
-        #     height=400
-        # )
-        
-        # panel = ft.ExpansionPanelList(
-        #     expand_icon_color=ft.colors.BLUE,
-        #     elevation=8,
-        #     controls=[
-        #         ft.ExpansionPanel(
-        #             header=ft.ListTile(title=ft.Text("Plot of the Recipe", color=color)),
-        #             content=chart_container,
-        #         )
-        #     ]
-        # )
-        
-        # self.plot = panel
-        # self.page.add(self.plot)
-        
+
 
     def remove_plot(self):
+        # only takes the plot off the page, the caller sends one page update for all changes
         if self.plot is not None and self.plot in self.page.controls:
-            self.page.remove(self.plot)
-            self.page.update()
-            self.plot = None
+            self.page.controls.remove(self.plot)
+        self.plot = None
         
 # Plot region end
 
@@ -295,12 +283,14 @@ class MainPage:
 
         
         compute_button = self.create_icon_button(ft.icons.CALCULATE, 48, self.compute, "Compute")
+        self.cancel_button = self.create_icon_button(ft.icons.CANCEL, 40, self.cancel_compute, "Cancel computation")
+        self.cancel_button.visible = False
         add_button = self.create_icon_button(ft.icons.ADD, 40, self.add_row, "Add new ingredient")
         delete_button = self.create_icon_button(ft.icons.REMOVE, 40, self.delete_row, "Delete ingredient")
 
         self.page.bottom_appbar = ft.BottomAppBar(
             height = 64,
-            content= ft.Row([add_button, delete_button,ft.Container(expand=True), compute_button]),
+            content= ft.Row([add_button, delete_button,ft.Container(expand=True), self.cancel_button, compute_button]),
             padding = ft.padding.symmetric(horizontal=8)
         )
         
@@ -379,7 +369,7 @@ class MainPage:
 
         Nutrients =  None       # Nutrients should be provided in the input later on
         if Nutrients == None:
-            Nutrients = [0,0,0,0,0,0]
+            Nutrients = [None] * 6      # None = not declared, 0 would constrain the product to contain none of it
 
         if not self.validate_input(values_input):
             self.ingredients = None
@@ -390,107 +380,88 @@ class MainPage:
         # set the computing flag to True
         self.computing = True
         
-        # delete the output text and the plot
-        self.remove_all_output(e)
-        
-        self.SAMPLES = Input.createMatrices(self.ingredients, values_input, Nutrients, self.page)
-       
-        # Output the results
-        self.output()
-        self.compute_plot()
+        # the results table is updated in place once the new result is there,
+        # the plot and the AI output belong to the old result
+        self.remove_plot()
+        self.remove_ai_output()
+        
+        # repeated labels are served from the result cache instead of running the MCMC again
+        cached = ResultCache.load_result(self.ingredients, values_input, Nutrients=Nutrients)
+        if cached is not None:
+            self.SAMPLES = cached["samples"]
+            self.output()
+            self.compute_plot()
+            self.save_history(values_input, Nutrients)
+            self.computing = False
+            return
 
-        # set the computing flag to False
-        self.computing = False 
+        # the sampling runs in a background thread, so the page stays responsive and can be cancelled
+        self.cancel_event = threading.Event()
+        self.cancel_button.visible = True
+        self.page.update()
+        threading.Thread(target=self.run_sampler, args=(values_input, Nutrients), daemon=True).start()
 
-   
-    def validate_input(self, values_input):
-        max_index = len(values_input) - 1
 
-        #if every amount is given
-        
-        if not None in values_input:
-            if sum(values_input) != 1:
-                self.page.show_snack_bar(
-                    ft.SnackBar(
-                        ft.Text("The amounts are given and do not add up to 100%! Please adjust your inputs!"), 
-                        open=True,
-                        bgcolor=ft.colors.RED_200)
-                    )
-                return False
-            return True
-
-
-        #checking whether the order of values is correct
-
-        temp = values_input.copy()
-        temp = [value for value in temp if value is not None]
-        for ind in range(len(temp)):
-            if(temp[ind] > temp[max(0, ind - 1)]):
-                self.page.show_snack_bar(
-                ft.SnackBar(
-                    ft.Text("Amounts are not in the right order! Please adjust your inputs!"), 
-                    open=True,
-                    bgcolor=ft.colors.RED_200)
-                 )
-                return False
-
-        #get minimum value of the inputs and check if its under 100%
-
-        temp = values_input.copy()
-        for ind in range(len(values_input)):
-            if values_input[max_index - ind] == None:
-                if max_index - ind + 1 < len(values_input):
-                    temp[max_index - ind] = temp[max_index - ind + 1]
-                else:
-                    temp[max_index - ind] = 0
-        if sum([float(value) for value in temp]) > 1:
-            self.page.show_snack_bar(
-                ft.SnackBar(
-                    ft.Text("With those amounts the total amount is going to be over 100%! Please adjust your inputs!"), 
-                    open=True,
-                    bgcolor=ft.colors.RED_200)
-            )
-            return False
-        
+    def run_sampler(self, values_input, Nutrients):
+        try:
+            with LoadingBar(self.page) as loading_bar:
+                self.SAMPLES = Input.createMatrices(self.ingredients, values_input, Nutrients, progress=loading_bar, cancel=self.cancel_event)
+        except MainCode.SamplingCancelled:
+            # the table still shows the previous result, which does not belong to the current inputs
+            self.delete_output_text()
+            self.popup_snackbar("The computation was cancelled", ft.colors.RED_200)
+        except Exception as error:
+            # errors of the thread would otherwise be lost, e.g. a label without interior point or a solver error
+            logger.exception("sampling failed")
+            self.delete_output_text()
+            self.popup_snackbar(f"The computation failed: {error}", ft.colors.RED_200)
+        else:
+            # Output the results
+            self.output()
+            self.compute_plot()
+            self.save_result(values_input, Nutrients)
+            self.save_history(values_input, Nutrients)
+        finally:
+            # set the computing flag to False
+            self.cancel_button.visible = False
+            self.cancel_event = None
+            self.computing = False
+            self.page.update()
 
-        #get maximum value of the inputs and check if its over 100%
-        if values_input[0] == None:
-            return True
-
-        temp = values_input.copy()
-        for ind in range(len(values_input)):
-            if values_input[ind] == None:
-                if ind - 1 >= 0:
-                    temp[ind] = temp[ind - 1]
-                else:
-                    temp[ind] = 0
-        #print(temp)
-        if sum([float(value) for value in temp]) < 1:
-            self.page.show_snack_bar(
-                ft.SnackBar(
-                    ft.Text("With those amounts the total amount is going to be under 100%! Please adjust your inputs!"), 
-                    open=True,
-                    bgcolor=ft.colors.RED_200)
-            )
-            return False
-        
-        # check if the ingredient names are unique
-        n = len(self.ingredients)
-        for i in range(n):
-            for j in range(i + 1, n):
-                if self.ingredients[i] == self.ingredients[j]:
-                    self.popup_snackbar("Please enter non-repeating ingredient names", ft.colors.RED_200)
-                    return False
-     
-        return True
+
+    def save_result(self, values_input, Nutrients):
+        # the result is shown anyway, a full disk or a read-only data/ only means it is computed again next time
+        try:
+            ResultCache.save_result(self.ingredients, values_input, self.SAMPLES, Nutrients=Nutrients)
+        except OSError:
+            logger.exception("could not save the estimate to the result cache")
+
+
+    def save_history(self, values_input, Nutrients):
+        # a full disk or a locked database should not stop the page from showing the result
+        try:
+            DataManager.save_data(self.ingredients, Nutrients, self.recipe_name.value, values_input, self.SAMPLES)
+        except sqlite3.Error:
+            logger.exception("could not save the estimate to the history")
+
+
+    def cancel_compute(self, e):
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+
+   
+    def validate_input(self, values_input):
+        # same checks as for the batch and API paths, see backend/Feasibility.py
+        feasibility = Feasibility.check(self.ingredients, values_input)
+        if not feasibility:
+            self.popup_snackbar(feasibility.message, ft.colors.RED_200)
+        return feasibility.feasible
         
         
     def output(self):
 
         self.mean_sample = np.mean(self.SAMPLES, axis=0)
         std_sample = np.std(self.SAMPLES, axis=0)
-        textSize = 15  
-        recipe_name = ft.Text("Dish: " + self.recipe_name.value, theme_style=ft.TextThemeStyle.TITLE_MEDIUM)
         rows = []
 
         self.name = self.recipe_name.value
@@ -504,82 +475,87 @@ class MainPage:
             self.popup_snackbar("Please enter a valid number for the dish amount", ft.colors.RED_200)
             
         for i, ingredient in enumerate(self.ingredients):
-            rows.append(ft.DataRow(cells=[
-                ft.DataCell(ft.Text(ingredient, size=textSize)),
-                ft.DataCell(ft.Text(f"{round(self.mean_sample[i] * int(whole_amount))}g", size=textSize)),
-                ft.DataCell(ft.Text(f"{self.mean_sample[i] * 100:5.2g}%", size=textSize)),
-                ft.DataCell(ft.Text(f"+/- {2 * std_sample[i] * 100:4.2f}%", size=textSize))
-            ]))
-            output_table = ft.DataTable(
-                columns=[
-                    ft.DataColumn(ft.Text("Ingredient", size=textSize, weight=ft.FontWeight.BOLD)),
-                    ft.DataColumn(ft.Text("Amount", size=textSize, weight=ft.FontWeight.BOLD)),
-                    ft.DataColumn(ft.Text("Percentage", size=textSize, weight=ft.FontWeight.BOLD)),
-                    ft.DataColumn(ft.Text("Deviation", size=textSize, weight=ft.FontWeight.BOLD)),
-                ],
-                rows = rows,
-                
-            )
-        
-        self.text_elements = ft.Column([
-                ft.Container(content=recipe_name, alignment=ft.alignment.center),
-                ft.Container(content=output_table, alignment=ft.alignment.center),
-            ],)
-        
-        self.page.add(self.text_elements)
+            rows.append((
+                ingredient,
+                f"{round(self.mean_sample[i] * int(whole_amount))}g",
+                f"{self.mean_sample[i] * 100:5.2g}%",
+                f"+/- {2 * std_sample[i] * 100:4.2f}%",
+            ))
+        self.results.set_values("Dish: " + self.recipe_name.value, rows)
+
+        # the table stays on the page between computations, the caller sends the changes with its next page update
+        if self.text_elements is None:
+            self.text_elements = self.results.control
+            self.page.add(self.text_elements)
 
 
 
     def createRecipe(self,e):
-        if self.name is None or self.ingredients is None or self.mean_sample is None or self.text_elements is None:
+        if self.computing or self.name is None or self.ingredients is None or self.mean_sample is None or self.text_elements is None:
             self.popup_snackbar("There is no recipe to create", ft.colors.RED_200)
             return
-        if self.ai_output is not None:
-            self.page.remove(self.ai_output)
-            self.ai_output = None
-            
-        self.remove_plot()
+        self.remove_ai_output()
+
         prompt = createRecipe.createPrompt(self.name, self.ingredients, self.mean_sample)
         print(prompt)
-        recipe = self.model.getRecipe(prompt)
-        print(recipe)
         test = ft.Text(f"AI Output:", weight=ft.FontWeight.BOLD, size=15)
-        reccipe = ft.Text(recipe, weight=ft.FontWeight.W_400, size=15)
+        reccipe = ft.Text("Generating recipe...", weight=ft.FontWeight.W_400, size=15)
         self.ai_output = ft.Container(
             content=ft.Column([test, reccipe]),
             alignment=ft.alignment.center,
             padding=ft.padding.all(20),
         )
-        self.page.add(self.ai_output)
-        self.compute_plot()
+        # the output goes above the plot, the plot itself is kept as it is
+        if self.plot is not None and self.plot in self.page.controls:
+            self.page.controls.insert(self.page.controls.index(self.plot), self.ai_output)
+            self.page.update()
+        else:
+            self.page.add(self.ai_output)
+
+        # the model is shared by all sessions and only loaded by the first click.
+        # the text is updated while the recipe is generated, only the text control is sent to the browser
+        # closing the stream right away on break stops the generation in the background
+        output = self.ai_output
+        with closing(createRecipe.get_model().streamRecipe(prompt)) as stream:
+            for recipe in stream:
+                if self.ai_output is not output:
+                    break  # the output was removed (new recipe, new computation) while generating
+                reccipe.value = recipe
+                reccipe.update()
+        print(reccipe.value)
         
 
 
         
     def delete_output_text(self):
         if self.text_elements is not None:
-            self.page.remove(self.text_elements)
-            if self.ai_output is not None:
-                self.page.remove(self.ai_output)
-                self.ai_output = None
+            self.page.controls.remove(self.text_elements)
             self.text_elements = None
+        self.remove_ai_output()
+
+
+    def remove_ai_output(self):
+        if self.ai_output is not None and self.ai_output in self.page.controls:
+            self.page.controls.remove(self.ai_output)
+        self.ai_output = None
 
                         
-    def remove_all_output(self,e):
+    def remove_all_output(self, e, update=True):
         self.remove_plot()
         self.delete_output_text()
+        if update:
+            self.page.update()
         
 
     # delete all output text and plot
     def new_recipe(self, e):
         self.recipe_name.value = ""
         self.recipe_whole_amount.value = ""
-        self.remove_all_output(e)
-        if self.input_rows:
-            for row in self.input_rows:
-                self.page.remove(row)
-                self.page.update()
-            self.input_rows = []
+        self.remove_all_output(e, update=False)
+        for row in self.input_rows:
+            self.page.controls.remove(row)
+        self.input_rows = []
+        # one update for all removed rows and outputs
         self.page.update()
     
     
@@ -593,6 +569,37 @@ class MainPage:
             )
     
         
+# native flet bar chart of the mean (bars) and mean +- std (thin orange bars) in %, no image has to be rendered.
+# the labels follow the theme, so toggling the dark mode does not need a new chart
+def bar_chart(ingredients, mean_sample, std_sample):
+    groups = []
+    for i, ingredient in enumerate(ingredients):
+        mean = mean_sample[i] * 100
+        std = std_sample[i] * 100
+        groups.append(ft.BarChartGroup(
+            x=i,
+            bar_rods=[
+                ft.BarChartRod(to_y=mean, width=20, color="#0b105c", border_radius=0, tooltip=f"{ingredient}: {mean:.2f}%"),
+                ft.BarChartRod(from_y=max(mean - std, 0), to_y=min(mean + std, 100), width=4, color="#FF5722", border_radius=0, tooltip=f"+/- {std:.2f}%"),
+            ],
+        ))
+
+    return ft.BarChart(
+        bar_groups=groups,
+        left_axis=ft.ChartAxis(labels_size=40, title=ft.Text("Proportion of Ingredients"), title_size=20),
+        bottom_axis=ft.ChartAxis(
+            labels=[ft.ChartAxisLabel(value=i, label=ft.Text(ingredient, size=12)) for i, ingredient in enumerate(ingredients)],
+            labels_size=40,
+            title=ft.Text("Mean and Standard Deviation of Ingredients in the Recipe"),
+            title_size=20,
+        ),
+        horizontal_grid_lines=ft.ChartGridLines(interval=10, color=ft.colors.with_opacity(0.2, ft.colors.ON_SURFACE), width=1),
+        min_y=0,
+        max_y=100,
+        expand=True,
+    )
+
+
 def main(page: ft.Page):
     global tutorial_shown
     
@@ -606,6 +613,8 @@ def main(page: ft.Page):
         tutorial_shown = True
 
 
-# Swap between the two lines below to run the app in the browser or in the terminal   
-ft.app(main, assets_dir="./backend/tutorial_pictures")   
-#ft.app(main, view=ft.AppView.WEB_BROWSER, assets_dir="./backend/tutorial_pictures")
+# the guard keeps worker processes of MainCode.MCMC_parallel from starting the app again
+if __name__ == "__main__":
+    # Swap between the two lines below to run the app in the browser or in the terminal   
+    ft.app(main, assets_dir="./backend/tutorial_pictures")   
+    #ft.app(main, view=ft.AppView.WEB_BROWSER, assets_dir="./backend/tutorial_pictures")
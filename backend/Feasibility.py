@@ -0,0 +1,72 @@
+import numpy as np
+from dataclasses import dataclass
+
+# Checks whether a label can be estimated at all, before any matrix is built: unique ingredient names,
+# given amounts in decreasing order, and a total of 100% that is reachable with the missing amounts.
+# Every missing amount lies between the next given amount after it (or 0) and the given amount before it
+# (unbounded for the first ingredients), so filling the gaps backwards/forwards gives the smallest and the
+# largest total. Used by the web input, Input.createMatrices and the API.
+
+TOLERANCE = 1e-9
+
+
+@dataclass
+class Feasibility:
+    feasible: bool
+    reason: str  # "ok" or a short code of the first failed check, e.g. "not_ordered"
+    message: str  # text for the user
+    lowest: np.ndarray  # amounts with every gap filled as low as possible
+    highest: np.ndarray  # ... as high as possible (inf before the first given amount)
+
+    @property
+    def min_total(self):
+        return float(np.sum(self.lowest))
+
+    @property
+    def max_total(self):
+        return float(np.sum(self.highest))
+
+    def __bool__(self):
+        return self.feasible
+
+
+def as_array(givenAmounts):
+    # None (not given) becomes nan
+    return np.array([np.nan if amount is None else amount for amount in givenAmounts], dtype=float)
+
+
+def fill_forward(values, fill):
+    # every nan gets the last value before it, or fill if there is none
+    D = len(values)
+    index = np.maximum.accumulate(np.where(np.isnan(values), -1, np.arange(D)))
+    return np.where(index >= 0, values[np.maximum(index, 0)], fill)
+
+
+def fill_bounds(givenAmounts):
+    values = as_array(givenAmounts)
+    lowest = fill_forward(values[::-1], 0)[::-1]
+    highest = fill_forward(values, np.inf)
+    return lowest, highest
+
+
+def check(Ingredients, givenAmounts, tolerance=TOLERANCE):
+    values = as_array(givenAmounts)
+    lowest, highest = fill_bounds(givenAmounts)
+    known = values[~np.isnan(values)]
+
+    def result(reason, message):
+        return Feasibility(reason == "ok", reason, message, lowest, highest)
+
+    if len(set(Ingredients)) != len(Ingredients):
+        return result("duplicate_names", "Please enter non-repeating ingredient names")
+    if np.any(known < -tolerance):
+        return result("negative_amount", "Amounts can not be negative! Please adjust your inputs!")
+    if np.any(np.diff(known) > tolerance):
+        return result("not_ordered", "Amounts are not in the right order! Please adjust your inputs!")
+    if len(known) == len(values) and abs(np.sum(known) - 1) > tolerance:
+        return result("sum_not_one", "The amounts are given and do not add up to 100%! Please adjust your inputs!")
+    if np.sum(lowest) > 1 + tolerance:
+        return result("over_total", "With those amounts the total amount is going to be over 100%! Please adjust your inputs!")
+    if np.sum(highest) < 1 - tolerance:
+        return result("under_total", "With those amounts the total amount is going to be under 100%! Please adjust your inputs!")
+    return result("ok", "")
@@ -1,97 +1,228 @@
 import backend.MainCode as MainCode
+import backend.Feasibility as Feasibility
+import logging
 import numpy as np
-import flet as ft
-from matplotlib import pyplot as plt
+from functools import lru_cache
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+
+# order of the nutrition facts in Nutrients, in the columns of a nutrient table and in the data/ files
+NUTRIENTS = ['carbs', 'fat', 'protein', 'salt', 'fiber', 'sugar']
+
+# declared nutrition facts are rounded and may deviate from the real product, so they only bound the
+# content to value +- max(relative * value, absolute). Amounts are fractions, 0.01 is 1 g per 100 g.
+NUTRIENT_RELATIVE_TOLERANCE = 0.2
+NUTRIENT_ABSOLUTE_TOLERANCE = 0.01
 
 # Function to create the needed Equality and Inequality matrices
-# this function might need to be changed in the future when we decide to also consider the Nutritional values of the products
-def createMatrices(Ingredients, givenAmounts, Nutrients, page: ft.Page):
-    testResult = checkForSimpleSolutions(Ingredients, givenAmounts, Nutrients, page)
+# Nutrients holds the declared nutrition facts of the product (in the order of NUTRIENTS, None if not declared),
+# nutrient_table the content of every ingredient (one row per ingredient, None or nan if not known).
+# Both are fractions like givenAmounts, without a table the nutrition facts do not constrain anything.
+def createMatrices(Ingredients, givenAmounts, Nutrients, nutrient_table=None, progress=None, cancel=None):
+    # labels that can not be estimated are rejected before any matrix, LP or MCMC work is done
+    feasibility = Feasibility.check(Ingredients, givenAmounts)
+    if not feasibility:
+        raise ValueError(feasibility.message)
+
+    C, c = nutrientConstraints(Nutrients, nutrient_table)
+    testResult = checkForSimpleSolutions(Ingredients, givenAmounts, Nutrients)
+    if testResult is not None and len(c) > 0 and np.any(testResult @ C.T - c > Feasibility.TOLERANCE):
+        # the label already determines the amounts, the nutrient rows can only be checked, not sampled
+        logger.warning("nutrition facts do not fit the given amounts, they are ignored")
+    if testResult is None and len(c) == 0:
+        # the exact slice sampler does not know the nutrient rows
+        testResult = sampleSimplexSlice(givenAmounts)
     if testResult is not None:
         result = testResult
     else:
-        # Number of Ingredients
-        D = len(Ingredients)
-
-        # WE NEED 2D - 1 INEQUALITIES:
-        # * all variables should be >0: (D inequality constraints)
-        # * the i-th variable is larger than the i+1-th variable, for all i in [1,D-1] (D-1 inequalities)
-        #
-        # AND 1 + non 0 in givenAmounts EQUALITIES:
-        # * all variables should sum to 1 (the D-simplex, 1 equality)
-        # * the first variable (gek. Linsen) is 0.63 (1 equality)
-        # * the 8th variable (Salz) is equal to 0.016 (1 equality)
-
-        # inequalities A <= a
-        A = np.zeros((D + D - 1, D))
-        a = np.zeros(D + D - 1)
-
-        # first, the >=0 inequality
-        A[0:D, 0:D] = -np.eye(D)  # note the minus, for the >= equality
-        a[0:D] = 0
-
-        # then the ordering:
-        for i in range(D - 1):
-            A[D + i, i + 1] = 1
-            A[D + i, i] = -1
-            a[D + i] = 0
-
-        n = 1 + np.count_nonzero(givenAmounts)
-
-        # equalities B = b
-        B = np.zeros((n, D))
-        b = np.zeros(n)
-
-        # they all sum to 1:
-        B[0, :] = 1
-        b[0] = 1
-
-        # other equalities given by the givenAmounts:
-        for i in range(D):
-            if givenAmounts[i] != None:
-                B[n - 1, i] = 1
-                b[n - 1] = givenAmounts[i]
-                n -= 1
-
-        result = MainCode.execute_mcmc(Ingredients, A, a, B, b, Nutrients, page)
-    return result
+        A, a, B, b = labelConstraints(givenAmounts)
 
+        if len(c) > 0:
+            # the nutrient rows go after the cached ones, so MainCode.ordered_interior_point still sees the ordered structure
+            try:
+                return MainCode.execute_mcmc(Ingredients, np.vstack([A, C]), np.concatenate([a, c]), B, b, Nutrients, progress=progress, cancel=cancel).samples
+            except MainCode.InfeasibleError:
+                # the nutrient table does not fit the label (wrong matches, other recipe), the amounts still do
+                logger.warning("nutrition facts do not fit the given amounts, sampling without them")
 
-def checkForSimpleSolutions(Ingredients, givenAmounts, Nutrients, page: ft.Page):
-    max_index = len(givenAmounts) - 1
-    result = None
-
-    temp1 = givenAmounts.copy()
-    for ind in range(len(givenAmounts)):
-        if givenAmounts[max_index - ind] == None:
-            if max_index - ind + 1 < len(givenAmounts):
-                temp1[max_index - ind] = temp1[max_index - ind + 1]
-            else:
-                temp1[max_index - ind] = 0
-
-    temp2 = givenAmounts.copy()
-    for ind in range(len(givenAmounts)):
-        if givenAmounts[ind] == None:
-            if ind - 1 >= 0:
-                temp2[ind] = temp2[ind - 1]
-            else:
-                temp2[ind] = 0
+        result = MainCode.execute_mcmc(Ingredients, A, a, B, b, Nutrients, progress=progress, cancel=cancel).samples
+    return result
 
 
-    if(givenAmounts.count(None) == 1):
+def nutrientConstraints(Nutrients, nutrient_table):
+    # inequalities C x <= c from the declared nutrition facts: the content of nutrient k is sum_i x_i * table[i, k].
+    # Ingredients with unknown content add at least 0, so the upper bound always holds for the known ones,
+    # the lower bound only if the content of every ingredient is known.
+    if Nutrients is None or nutrient_table is None:
+        return np.zeros((0, 0)), np.zeros(0)
+
+    table = np.array([[np.nan] * len(NUTRIENTS) if row is None else row for row in nutrient_table], dtype=float)
+    rows = []
+    values = []
+    for k, value in enumerate(Nutrients):
+        if value is None:
+            continue
+        tolerance = max(NUTRIENT_RELATIVE_TOLERANCE * value, NUTRIENT_ABSOLUTE_TOLERANCE)
+        content = table[:, k]
+        known = ~np.isnan(content)
+        if not np.any(content[known] > 0):
+            continue
+
+        rows.append(np.where(known, content, 0))
+        values.append(value + tolerance)
+        if np.all(known) and value - tolerance > 0:
+            rows.append(-content)
+            values.append(tolerance - value)
+
+    D = len(table)
+    return np.array(rows).reshape(-1, D), np.array(values)
+
+
+# headless version of MainPage.compute for the batch and API paths: estimates the amounts of one label
+def estimate(Ingredients, givenAmounts, Nutrients=None, nutrient_table=None, cancel=None):
+    start = perf_counter()
+    samples = createMatrices(Ingredients, givenAmounts, Nutrients, nutrient_table, cancel=cancel)
+    return {
+        "ingredients": list(Ingredients),
+        "mean": np.mean(samples, axis=0).tolist(),
+        "two_sigma": (2 * np.std(samples, axis=0)).tolist(),
+        "num_samples": int(samples.shape[0]),
+        "seconds": perf_counter() - start,
+    }
+
+
+@lru_cache(maxsize=128)
+def constraintMatrices(D, fixed):
+    # WE NEED 2D - 1 INEQUALITIES:
+    # * all variables should be >0: (D inequality constraints)
+    # * the i-th variable is larger than the i+1-th variable, for all i in [1,D-1] (D-1 inequalities)
+    #
+    # AND 1 + non 0 in givenAmounts EQUALITIES:
+    # * all variables should sum to 1 (the D-simplex, 1 equality)
+    # * the first variable (gek. Linsen) is 0.63 (1 equality)
+    # * the 8th variable (Salz) is equal to 0.016 (1 equality)
+
+    # inequalities A <= a
+    A = np.zeros((D + D - 1, D))
+    a = np.zeros(D + D - 1)
+
+    # first, the >=0 inequality
+    A[0:D, 0:D] = -np.eye(D)  # note the minus, for the >= equality
+    a[0:D] = 0
+
+    # then the ordering:
+    for i in range(D - 1):
+        A[D + i, i + 1] = 1
+        A[D + i, i] = -1
+        a[D + i] = 0
+
+    n = 1 + sum(fixed)
+
+    # equalities B = b, only the left hand side (b holds the given amounts)
+    B = np.zeros((n, D))
+
+    # they all sum to 1:
+    B[0, :] = 1
+
+    # other equalities given by the givenAmounts:
+    for i in range(D):
+        if fixed[i]:
+            B[n - 1, i] = 1
+            n -= 1
+
+    # the arrays are shared by every cache hit, so they must not be changed
+    for matrix in (A, a, B):
+        matrix.flags.writeable = False
+    return A, a, B
+
+
+# Constraints of a label: the cached matrices for D and the fixed pattern, and the right hand side b
+# of the equalities (total of 1 and the given amounts, in the order of the rows of B)
+def labelConstraints(givenAmounts):
+    D = len(givenAmounts)
+    fixed = tuple(amount != None for amount in givenAmounts)
+    A, a, B = constraintMatrices(D, fixed)
+
+    b = np.zeros(B.shape[0])
+    b[0] = 1
+    n = B.shape[0]
+    for i in range(D):
+        if givenAmounts[i] != None:
+            b[n - 1] = givenAmounts[i]
+            n -= 1
+    return A, a, B, b
+
+
+def cache_info():
+    # hit/miss counters of the cached constraint geometry
+    info = {"matrices": constraintMatrices.cache_info()}
+    info.update(MainCode.cache_info())
+    return info
+
+
+def checkForSimpleSolutions(Ingredients, givenAmounts, Nutrients):
+    # labels where the amounts are already determined: at most one missing amount, or a total of 100%
+    # that is only reached when every missing amount is as small (or as large) as possible
+    missing = givenAmounts.count(None)
+    if missing == 0:
+        return np.array([givenAmounts], dtype=float)
+    if missing == 1:
         # Plots fehlen für diesen Fall noch
-        temp = 1 - sum([x for x in givenAmounts if x != None])
-        givenAmounts[givenAmounts.index(None)] = temp
-        result = np.array([givenAmounts])
+        amounts = list(givenAmounts)
+        amounts[amounts.index(None)] = 1 - sum([x for x in givenAmounts if x != None])
+        return np.array([amounts], dtype=float)
+
+    lowest, highest = Feasibility.fill_bounds(givenAmounts)
+    for amounts in (lowest, highest):
+        if abs(np.sum(amounts) - 1) <= Feasibility.TOLERANCE:
+            return amounts[None, :]
+    return None
+
+
+# Exact sampler for labels where all unknown amounts are next to each other (e.g. 2 or 3 unknowns
+# between two given amounts). The unknowns y then only have to satisfy hi >= y_1 >= ... >= y_m >= lo
+# and sum(y) = rest, which is a simplex cut by y_1 <= hi. Shifted by lo, the ordered simplex has the
+# vertices (c/k, ..., c/k, 0, ..., 0), so uniform samples are Dirichlet(1) weighted sums of those
+# vertices, and the y_1 <= hi cut is handled by rejection. No LP and no MCMC are needed.
+MAX_SLICE_UNKNOWNS = 3
+MIN_SLICE_ACCEPTANCE = 0.01
+
+def sampleSimplexSlice(givenAmounts, num_samples=1000, rng=np.random):
+    D = len(givenAmounts)
+    unknown = [i for i in range(D) if givenAmounts[i] == None]
+    m = len(unknown)
+    if m < 2 or m > MAX_SLICE_UNKNOWNS or unknown[-1] - unknown[0] != m - 1:
+        return None
+
+    start, end = unknown[0], unknown[-1]
+    hi = givenAmounts[start - 1] if start > 0 else np.inf
+    lo = givenAmounts[end + 1] if end + 1 < D else 0
+    rest = 1 - sum(amount for amount in givenAmounts if amount != None)
+
+    # shift everything by lo, then the unknowns are an ordered simplex with sum c
+    c = rest - m * lo
+    if c <= 0 or hi < lo:
+        return None
+    vertices = np.array([[c / k if j < k else 0 for j in range(m)] for k in range(1, m + 1)])
+
+    accepted = []
+    count = 0
+    drawn = 0
+    while count < num_samples:
+        weights = rng.standard_exponential((num_samples, m))
+        weights /= weights.sum(axis=1, keepdims=True)
+        y = lo + weights @ vertices
+        y = y[y[:, 0] <= hi]
+        accepted.append(y)
+        count += len(y)
+        drawn += num_samples
+
+        # a very thin slice would need too many draws, the MCMC handles it instead
+        if count < MIN_SLICE_ACCEPTANCE * drawn:
+            return None
+
+    samples = np.tile(np.array([0 if amount == None else amount for amount in givenAmounts], dtype=float), (num_samples, 1))
+    samples[:, start:end + 1] = np.concatenate(accepted)[:num_samples]
+    return samples
 
-    elif(givenAmounts.count(None) == 0):
-        # Plots fehlen für diesen Fall noch
-        result = np.array([givenAmounts])
-    
-    elif sum([float(value) for value in temp1]) == 1:
-        result = np.array([temp1])
-    
-    elif sum([float(value) for value in temp2]) == 1:
-        result = np.array([temp2])
-    
-    return result
\ No newline at end of file
@@ -1,46 +1,211 @@
-import warnings
 import numpy as np
-import matplotlib
-from matplotlib import pyplot
-from numpy.random import randn
-from tqdm import tqdm
-from scipy.optimize import linprog
-import flet as ft
+import atexit
 import logging
-from time import sleep
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from functools import lru_cache
+from time import perf_counter
 
-logging.getLogger('matplotlib.font_manager').disabled = True
-matplotlib.use('Agg')
+# The sampler only depends on NumPy (and SciPy for general constraint sets), so it can run headless
+# in batch jobs, benchmarks and worker processes. Progress is reported through an optional
+# callable progress(fraction), the flet progress bar lives in WebInput.py.
 
+logger = logging.getLogger(__name__)
 
-def execute_mcmc(Zutaten, A, a, B, b, Nutrients, page: ft.Page):
+# sampler backend of a single chain, see SAMPLERS. numpy is the fastest without numba (see benchmarks/)
+DEFAULT_SAMPLER = os.environ.get("MCMC_BACKEND", "numpy")
+
+
+class SamplingCancelled(Exception):
+    # raised from inside the sampling loops once the cancel event passed to them is set
+    pass
+
+
+class InfeasibleError(ValueError):
+    # raised when the constraints have no strictly interior point to start the chains from
+    pass
+
+
+def check_cancelled(cancel):
+    # cancel is anything with is_set(), e.g. a threading.Event set by the cancel button of the UI
+    if cancel is not None and cancel.is_set():
+        raise SamplingCancelled()
+
+
+@dataclass
+class SamplingResult:
+    samples: np.ndarray  # thinned samples, one row per sample and one column per ingredient
+    mean: np.ndarray
+    std: np.ndarray
+    x0: np.ndarray  # initial point of the chains
+    num_iter: int  # total number of MCMC steps
+    seconds: float  # wall time of the run
+
+
+def execute_mcmc(Zutaten, A, a, B, b, Nutrients=None, num_chains=1, num_workers=None, seed=None, tolerance=None, backend=None, progress=None, cancel=None):
+    start = perf_counter()
     D = len(Zutaten)
+    # backend is used for single chains and the chains of the worker processes,
+    # the chains advanced together (num_chains, tolerance) are always vectorized with NumPy
+    sampler = get_sampler(backend or DEFAULT_SAMPLER)
 
     x0 = find_initial_point(A, a, B, b)
 
     # check your implementation:
-    print(f"Test for inequalities: {np.all(A @ x0 - a < 0)}")
-    print(f"Test for equalities: {np.allclose(B @ x0 - b,0)}")
+    logger.debug(f"Test for inequalities: {np.all(A @ x0 - a < 0)}")
+    logger.debug(f"Test for equalities: {np.allclose(B @ x0 - b,0)}")
 
     # now we can start the MCMC loop
     S = int(1e4)
-    SAMPLES = MCMC(D, A, a, B, b,page, num_iter=S, thinning=int(S / 100))
-    # DataManager.save_data(Zutaten, Nutrients, recipe_name)
-    
-    return SAMPLES
+    # steps the chains run before their samples are kept. a chain needs a few thousand
+    # steps to forget its start point (D=10), without them the means of many short chains are biased
+    burn_in = S // 2
+    if tolerance is not None:
+        # run until the standard error of every mean is below tolerance, instead of a fixed number of steps
+        SAMPLES, S = MCMC_adaptive(D, A, a, B, b, num_chains=max(num_chains, 4), tolerance=tolerance, x0=x0, progress=progress, cancel=cancel)
+    elif num_workers is not None and num_workers > 1:
+        # split the same budget over independent chains in separate processes
+        SAMPLES = MCMC_parallel(D, A, a, B, b, num_workers=num_workers, num_iter=S, thinning=int(S / 100), burn_in=burn_in, x0=x0, seed=seed, backend=backend or DEFAULT_SAMPLER, progress=progress, cancel=cancel)
+    elif num_chains > 1:
+        # split the same budget over several chains that are advanced together,
+        # thinned per chain so that even many short chains keep their samples
+        chain_iter = max(S // num_chains, 1)
+        SAMPLES = MCMC_chains(D, A, a, B, b, num_chains=num_chains, num_iter=chain_iter, thinning=max(1, chain_iter // 100), burn_in=burn_in, x0=x0, progress=progress, cancel=cancel)
+    else:
+        SAMPLES = sampler(D, A, a, B, b, num_iter=S, thinning=int(S / 100), x0=x0, progress=progress, cancel=cancel)
+    # the history is saved by the callers (WebInput.py, BatchInput.py), see data/DataManager.py
+
+    return SamplingResult(
+        samples=SAMPLES,
+        mean=np.mean(SAMPLES, axis=0),
+        std=np.std(SAMPLES, axis=0),
+        x0=x0,
+        num_iter=S,
+        seconds=perf_counter() - start,
+    )
 
 
 def find_initial_point(A, a, B, b):
+    # the constraints of Input.createMatrices have a strictly interior point we can write down directly,
+    # everything else is solved as a linear program
+    x0 = ordered_interior_point(A, a, B, b)
+    if x0 is None:
+        x0 = chebyshev_center(A, a, B, b)
+    return x0
+
+
+def ordered_interior_point(A, a, B, b):
+    """
+    Constructs a strictly interior point of "non-increasing, non-negative, sum to b[0],
+    some amounts fixed" in O(D), without a solver. Returns None if the constraints
+    do not have this structure or have no strictly interior point.
+    """
     D = A.shape[1]
+    if not is_ordered_simplex(A, a):
+        return None
+
+    # read the total and the fixed amounts from the equalities
+    total = None
+    x = np.full(D, np.nan)
+    for row, value in zip(B, b):
+        if np.all(row == 1):
+            total = value
+        elif np.count_nonzero(row) == 1 and np.max(row) == 1 and np.isnan(x[np.argmax(row)]):
+            x[np.argmax(row)] = value
+        else:
+            return None
+    if total is None:
+        return None
+
+    # runs of unknown amounts, each bounded by its given neighbours
+    unknown = np.isnan(x)
+    rest = total - np.sum(x[~unknown])
+    runs = []
+    i = 0
+    while i < D:
+        if unknown[i]:
+            start = i
+            while i < D and unknown[i]:
+                i += 1
+            hi = x[start - 1] if start > 0 else np.nan
+            lo = x[i] if i < D else 0
+            runs.append((start, i, hi, lo))
+        i += 1
+
+    if runs:
+        # a leading run has no upper neighbour, any bound that allows the whole rest works
+        runs = [(start, end, lo + rest if np.isnan(hi) else hi, lo) for start, end, hi, lo in runs]
+
+        # every run gets the same relative position lam between its bounds, chosen such that all sum to rest
+        lows = sum((end - start) * lo for start, end, _, lo in runs)
+        widths = sum((end - start) * (hi - lo) for start, end, hi, lo in runs)
+        if widths <= 0:
+            return None
+        lam = (rest - lows) / widths
+        if not 0 < lam < 1:
+            return None
+
+        # spread the run symmetrically around lam, so it is strictly decreasing with the same sum
+        delta = min(lam, 1 - lam)
+        for start, end, hi, lo in runs:
+            m = end - start
+            offsets = ((m + 1) / 2 - np.arange(1, m + 1)) / m
+            x[start:end] = lo + (hi - lo) * (lam + delta * offsets)
+
+    # further rows (nutrients) are not part of the construction, the point may violate them.
+    # the ordering of two equal given amounts can only hold with equality
+    free = ~implicit_equalities(A, B)
+    slack = A @ x - a
+    if not (np.all(slack[free] < 0) and np.all(slack[~free] <= 1e-12) and np.allclose(B @ x, b)):
+        return None
+    return x
+
+
+def implicit_equalities(A, B):
+    # rows of Ax <= a that are constant on Bx = b, e.g. the ordering x[i+1] <= x[i] of two equal given amounts.
+    # no point satisfies them strictly, so they are left out wherever a strictly interior point is needed
+    R, _ = null_space_basis(B)
+    return np.linalg.norm(A @ R, axis=1) <= 1e-12 * np.maximum(np.linalg.norm(A, axis=1), 1)
+
+
+def chebyshev_center(A, a, B, b):
+    # the center of the largest ball inside Ax <= a (within Bx = b) is strictly interior,
+    # unlike the vertices the simplex/HiGHS solvers return for a plain feasibility problem
+    # (scipy is only imported here, createMatrices only needs it for nutrient constraints)
+    from scipy.optimize import linprog
     
-    # Surpress deprecation warning
-    with warnings.catch_warnings():
-        warnings.filterwarnings("ignore", category=DeprecationWarning)
-        out = linprog(np.ones(D), A_ub=A, b_ub=a, A_eq=B, b_eq=b, method="interior-point")
-    return out.x
+    D = A.shape[1]
+    # implicit equalities still have to hold, but can not leave room for a ball
+    norms = np.where(implicit_equalities(A, B), 0, np.linalg.norm(A, axis=1))
+    c = np.zeros(D + 1)
+    c[-1] = -1  # maximize the radius
+    out = linprog(
+        c,
+        A_ub=np.hstack([A, norms[:, None]]),
+        b_ub=a,
+        A_eq=np.hstack([B, np.zeros((B.shape[0], 1))]),
+        b_eq=b,
+        bounds=[(None, None)] * D + [(0, 1)],
+        method="highs",
+    )
+    if out.status != 0 or out.x[-1] <= 0:
+        raise InfeasibleError(f"constraints have no strictly interior point: {out.message}")
+    return out.x[:D]
 
 
-def construct_directions(B):
+def null_space_basis(B):
+    # the basis only depends on B, which for Input.createMatrices only depends on the
+    # number of ingredients and which of them are fixed, so repeated requests hit the cache
+    B = np.asarray(B, dtype=float)
+    return _null_space_basis(B.shape, B.tobytes())
+
+
+@lru_cache(maxsize=128)
+def _null_space_basis(shape, data):
     """
     The main challenge here is to ensure the equality constraints remain satisfied
     Naïvely using random.multivariatenormal or similar typically adds a "nugget",
@@ -49,6 +214,7 @@ def construct_directions(B):
     then setting all directions that have nearly zero singular values to an actual zero.
     """
 
+    B = np.frombuffer(data).reshape(shape)
     _, D = B.shape
     q, s, ut = np.linalg.svd(
         B, full_matrices=False
@@ -59,11 +225,24 @@ def construct_directions(B):
     R = Q[:, S != 0]  # only keep directions with nonzero singular value
     S = np.sqrt(S[S != 0])
 
+    # the arrays are shared by every cache hit, so they must not be changed
+    R.flags.writeable = False
+    S.flags.writeable = False
+    return R, S
+
+
+def cache_info():
+    # hit/miss counters of the cached null-space bases
+    return {"directions": _null_space_basis.cache_info()}
+
+
+def construct_directions(B):
+    R, S = null_space_basis(B)
     K = R.shape[1]
 
     # now define the sampling function, as per usual for multivariate Gaussians:
-    def sample():
-        u = R @ np.reshape(np.sqrt(S) * randn(K), [K, 1])
+    def sample(rng=np.random):
+        u = R @ np.reshape(np.sqrt(S) * rng.standard_normal(K), [K, 1])
         if np.linalg.norm(u) != 0:
             u /= np.linalg.norm(u)
         return u.flatten()
@@ -71,23 +250,46 @@ def construct_directions(B):
     return sample
 
 
-def project_and_sample(xi, s, A, a):
+def is_ordered_simplex(A, a):
+    """
+    Checks whether Ax <= a starts with the constraints Input.createMatrices builds:
+    the D rows of -x <= 0 followed by the D-1 rows x[i+1] - x[i] <= 0.
+    Only for these ordered_interior_point can build a point directly, any further
+    rows (e.g. nutrition facts) are checked afterwards.
+    """
+    D = A.shape[1]
+    if A.shape[0] < 2 * D - 1 or np.any(a[:2 * D - 1] != 0):
+        return False
+    ordering = np.zeros((D - 1, D))
+    ordering[np.arange(D - 1), np.arange(D - 1)] = -1
+    ordering[np.arange(D - 1), np.arange(1, D)] = 1
+    return np.array_equal(A[:D], -np.eye(D)) and np.array_equal(A[D:2 * D - 1], ordering)
+
+
+def step_bounds(y, z):
+    # find the *tightest* of all constraints in both directions (i.e. towards xi + d and xi - d).
+    # the constraints are along the last axis, so y and z can also hold one row per chain
+    positive = z > 0
+    negative = z < 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = -y / z
+    upper = np.min(np.where(positive, t, np.inf), axis=-1)
+    lower = np.max(np.where(negative, t, -np.inf), axis=-1)
+
+    # constraints parallel to the direction limit the step to [0, 1]
+    parallel = ~np.all(positive | negative, axis=-1)
+    upper = np.where(parallel, np.minimum(upper, 1), upper)
+    lower = np.where(parallel, np.maximum(lower, 0), lower)
+
+    return lower, upper
+
+
+def project_and_sample(xi, s, A, a, rng=np.random):
     # take direction d, project the inequality constraints Ax <= a onto it, and sample
     y = (A @ xi) - a  # value of inequality constraints
     z = A @ s  # projected onto the slice
 
-    # find the *tightest* of all constraints in both directions (i.e. towards xi + d and xi - d).
-    K = len(y)
-    upper = np.inf
-    lower = -np.inf
-    for k in range(K):
-        if z[k] > 0:
-            upper = np.minimum(upper, -y[k] / z[k])
-        elif z[k] < 0:
-            lower = np.maximum(lower, -y[k] / z[k])
-        else:
-            upper = np.minimum(upper, 1)
-            lower = np.maximum(lower, 0)
+    lower, upper = step_bounds(y, z)
 
     # sanity checks:
     assert np.isfinite(lower) and np.isfinite(
@@ -95,64 +297,541 @@ def project_and_sample(xi, s, A, a):
     ), f"lower bound {lower} and upper bound {upper}"  # constraints exist
     
     # sample:
-    a = lower + (upper - lower) * np.random.rand()
+    a = lower + (upper - lower) * rng.random()
 
     return xi + a * s
 
 
-def MCMC(D, A, a, B, b,page: ft.Page, num_iter=int(1e7), thinning=int(1e5)):
+def MCMC(D, A, a, B, b, num_iter=int(1e7), thinning=int(1e5), x0=None, rng=np.random, progress=None, cancel=None):
 
-    print("finding initial point.")
+    if x0 is None:
+        logger.debug("finding initial point.")
+        x0 = find_initial_point(A, a, B, b)
+
+    logger.debug("starting MCMC loop")
+    # only the thinned samples are kept, instead of all num_iter steps
+    num_samples = len(range(0, num_iter, thinning))
+    samples = np.zeros(shape=(num_samples, D))
+    
+    stream = iter_MCMC(A, a, B, b, x0, num_iter=num_iter, thinning=thinning, rng=rng, progress=progress, cancel=cancel)
+    for k, xi in enumerate(stream):
+        samples[k, :] = xi
     
-    # suppress deprecation warning
-    with warnings.catch_warnings():
-        warnings.filterwarnings("ignore", category=DeprecationWarning)
-        out = linprog(np.ones(D), A_ub=A, b_ub=a, A_eq=B, b_eq=b, method="interior-point")
-    x0 = out.x.flatten()
+    return samples
+
+
+def iter_MCMC(A, a, B, b, x0, num_iter=int(1e7), thinning=int(1e5), rng=np.random, progress=None, cancel=None):
+    # generator version of the MCMC loop: yields x0 and then every thinning-th step,
+    # so memory does not grow with num_iter. progress is called with the done fraction every 1%,
+    # which is also when the cancel event is checked
+
+    logger.debug("precomputing space of search directions")
+    walk = NullSpaceWalk(A, a, B, x0)
+
+    yield x0
+
+    for i in range(num_iter - 1):
+        walk.step(rng)
+        if (i + 1) % thinning == 0:
+            yield walk.points()[0]
+
+        if i % max(num_iter // 100, 1) == 0:
+            check_cancelled(cancel)
+            if progress is not None:
+                progress(i / num_iter)
+
+
+class RunningMoments:
+    """
+    Mean and variance of a stream of samples with Welford's method,
+    so the summary of a run needs O(D) memory instead of storing the samples.
+    """
+
+    def __init__(self, D):
+        self.count = 0
+        self.mean = np.zeros(D)
+        self._m2 = np.zeros(D)
+
+    def update(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (x - self.mean)
+
+    @property
+    def var(self):
+        # population variance, the same as np.var / np.std use by default
+        if self.count == 0:
+            return np.full_like(self.mean, np.nan)
+        return self._m2 / self.count
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+
+def summarize_MCMC(A, a, B, b, x0, num_iter=int(1e7), thinning=int(1e5), rng=np.random, progress=None):
+    # runs the chain without keeping any samples and returns the running mean and variance
+    moments = RunningMoments(A.shape[1])
+    for xi in iter_MCMC(A, a, B, b, x0, num_iter=num_iter, thinning=thinning, rng=rng, progress=progress):
+        moments.update(xi)
+    return moments
+
+
+def MCMC_chains(D, A, a, B, b, num_chains=10, num_iter=int(1e3), thinning=int(1e2), burn_in=int(1e3), x0=None, rng=np.random, progress=None, cancel=None):
+    # runs num_chains independent hit-and-run chains at once, each for burn_in + num_iter steps.
+    # returns the thinned samples after the burn-in of all chains stacked into one (num_chains * num_iter // thinning, D) array
+
+    if x0 is None:
+        x0 = find_initial_point(A, a, B, b)
+
+    # the chains start from different points and forget them during the burn-in,
+    # otherwise short chains all report the neighbourhood of x0
+    walk = NullSpaceWalk(A, a, B, [jitter_initial_point(x0, A, a, B, rng) for _ in range(num_chains)])
+    samples = np.zeros(shape=(num_iter // thinning, num_chains, D))
+
+    total = burn_in + num_iter
+    for i in range(total):
+        walk.step(rng)
+
+        j = i - burn_in
+        if j >= 0 and (j + 1) % thinning == 0:
+            samples[(j + 1) // thinning - 1] = walk.points()
+
+        # report progress
+        if i % max(total // 100, 1) == 0:
+            check_cancelled(cancel)
+            if progress is not None:
+                progress(i / total)
+
+    return samples.reshape(-1, D)
+
+
+class NullSpaceWalk:
+    """
+    Hit-and-run for one or more chains, run directly in the coordinates c of the null space
+    of B: x = x0 + R c. A R is computed once, and the slack A x - a is updated with the step
+    (slack += t * (A R) d), so a step costs one small (2D-1) x K matvec instead of two dense
+    ones in the full D-space. The points are only built when they are needed (thinned samples).
+    """
+
+    def __init__(self, A, a, B, X0):
+        R, S = null_space_basis(B)
+        self.R = R
+        self.scale = np.sqrt(S)  # same scaling of the directions as construct_directions
+        self.AR = A @ R
+        self.A = A
+        self.a = a
+        self.X0 = np.atleast_2d(np.asarray(X0, dtype=float))
+        self.C = np.zeros((self.X0.shape[0], R.shape[1]))
+        self.Y = self.slack(self.X0)
+
+    def slack(self, X):
+        # value of the inequality constraints for every chain (row) of X
+        return X @ self.A.T - self.a
 
-    print("precomputing space of search directions")
+    def step(self, rng=np.random):
+        N, K = self.C.shape
+        if N == 1:
+            return self._step_single(rng)
+        d = self.scale * rng.standard_normal((N, K))
+        # R has orthonormal columns, so normalizing d normalizes the direction R d
+        norms = np.linalg.norm(d, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        d /= norms
+
+        Z = d @ self.AR.T  # constraints projected onto the directions
+        lower, upper = step_bounds(self.Y, Z)
+        assert np.all(np.isfinite(lower)) and np.all(
+            np.isfinite(upper)
+        ), f"lower bound {lower} and upper bound {upper}"  # constraints exist
+
+        t = lower + (upper - lower) * rng.random(N)
+        self.C += t[:, None] * d
+        self.Y += t[:, None] * Z
+
+    def _step_single(self, rng):
+        # the same step for one chain (and the same random numbers). a label has only 2D-1 rows, so
+        # the bounds are cheaper as a loop over Python floats than as the masked reductions of step_bounds
+        c, y = self.C[0], self.Y[0]
+        d = self.scale * rng.standard_normal(c.shape[0])
+        norm = math.sqrt(d @ d)
+        if norm > 0:
+            d /= norm
+
+        z = self.AR @ d
+        lower, upper = -math.inf, math.inf
+        parallel = False
+        for yj, zj in zip(y.tolist(), z.tolist()):
+            if zj > 0:
+                if -yj / zj < upper:
+                    upper = -yj / zj
+            elif zj < 0:
+                if -yj / zj > lower:
+                    lower = -yj / zj
+            else:
+                parallel = True
+        if parallel:
+            upper = min(upper, 1.0)
+            lower = max(lower, 0.0)
+        assert math.isfinite(lower) and math.isfinite(upper), f"lower bound {lower} and upper bound {upper}"  # constraints exist
+
+        t = lower + (upper - lower) * rng.random()
+        c += t * d
+        y += t * z
+
+    def points(self):
+        X = self.X0 + self.C @ self.R.T
+        # recompute the slack from the points, so rounding errors of the updates do not add up
+        self.Y = self.slack(X)
+        return X
+
+
+def MCMC_adaptive(D, A, a, B, b, num_chains=4, tolerance=1e-3, block=int(1e3), thinning=10, max_iter=int(1e5), x0=None, rng=np.random, progress=None, cancel=None):
+    """
+    Runs num_chains chains in blocks of block steps until the standard error std / sqrt(ESS)
+    of every ingredient mean is below tolerance and split-R-hat is below 1.01, or until
+    max_iter steps per chain. The first block is discarded as burn-in.
+    Returns the thinned samples of all chains and the total number of steps.
+    """
+    if x0 is None:
+        x0 = find_initial_point(A, a, B, b)
+
+    block = max(block // thinning, 1) * thinning
+
+    # the chains start from different points, otherwise R-hat cannot see unmixed chains
+    walk = NullSpaceWalk(A, a, B, [jitter_initial_point(x0, A, a, B, rng) for _ in range(num_chains)])
+    for _ in range(block):
+        walk.step(rng)
+    steps = block
+
+    kept = []
+    while True:
+        for i in range(block):
+            walk.step(rng)
+            if (i + 1) % thinning == 0:
+                kept.append(walk.points())
+        steps += block
+        check_cancelled(cancel)
+
+        chains = np.stack(kept, axis=1)  # (num_chains, samples per chain, D)
+        error = np.std(chains.reshape(-1, D), axis=0) / np.sqrt(effective_sample_size(chains))
+        converged = np.all(error < tolerance) and np.all(split_rhat(chains) < 1.01)
+        logger.debug(f"{steps} steps per chain, largest standard error {np.max(error):.2g}")
+        if progress is not None:
+            progress(min(steps / max_iter, 1))
+        if converged or steps >= max_iter:
+            break
+
+    return chains.reshape(-1, D), steps * num_chains
+
+
+def jitter_initial_point(x0, A, a, B, rng, steps=10):
+    # moves x0 a few hit-and-run steps, so that independent chains do not all start at the same point
     sample = construct_directions(B)
+    xi = x0
+    for _ in range(steps):
+        xi = project_and_sample(xi, sample(rng), A, a, rng)
+    return xi
+
+
+# process pools of MCMC_parallel, one per size. They are started by the first call and reused, so an
+# estimate does not pay for starting processes and importing numpy in them every time. The manager
+# process holds the cancel events, which (unlike threading.Event) reach the chains in the workers.
+_pools = {}
+_manager = None
+_pool_lock = threading.Lock()
 
-    print("starting MCMC loop")
-    samples = np.zeros(shape=(num_iter, D))
+
+def worker_pool(num_workers):
+    with _pool_lock:
+        if num_workers not in _pools:
+            _pools[num_workers] = ProcessPoolExecutor(max_workers=num_workers)
+        return _pools[num_workers]
+
+
+def worker_event():
+    global _manager
+    with _pool_lock:
+        if _manager is None:
+            _manager = multiprocessing.Manager()
+        return _manager.Event()
+
+
+@atexit.register
+def shutdown_pools():
+    global _manager
+    with _pool_lock:
+        for pool in _pools.values():
+            pool.shutdown(wait=False)
+        _pools.clear()
+        if _manager is not None:
+            _manager.shutdown()
+            _manager = None
+
+
+def _run_chain(D, A, a, B, b, x0, num_iter, thinning, seed, backend="numpy", cancel=None, burn_in=0):
+    # runs in a worker process, progress is reported by the parent once the chain is done.
+    # the burn-in is rounded up to whole thinning intervals and its samples are dropped
+    rng = np.random.default_rng(seed)
+    x0 = jitter_initial_point(x0, A, a, B, rng)
+    skip = -(-burn_in // thinning)
+    samples = get_sampler(backend)(D, A, a, B, b, num_iter=num_iter + skip * thinning, thinning=thinning, x0=x0, rng=rng, cancel=cancel)
+    return samples[skip:]
+
+
+def MCMC_parallel(D, A, a, B, b, num_workers=4, num_iter=int(1e4), thinning=int(1e2), burn_in=int(1e3), x0=None, seed=None, backend="numpy", executor=None, progress=None, cancel=None):
+    # splits num_iter steps over num_workers independent chains in a process pool (the shared one of
+    # worker_pool unless an executor is given). every chain runs burn_in steps more, which are discarded.
+    # every worker gets its own seed derived from seed, so runs with the same seed are reproducible
+
+    if x0 is None:
+        x0 = find_initial_point(A, a, B, b)
+
+    seeds = np.random.SeedSequence(seed).spawn(num_workers)
+    chain_iter = max(num_iter // num_workers, 1)
+
+    pool = executor if executor is not None else worker_pool(num_workers)
+    stop = worker_event()
+    futures = [pool.submit(_run_chain, D, A, a, B, b, x0, chain_iter, thinning, worker_seed, backend, stop, burn_in) for worker_seed in seeds]
+    try:
+        # report progress whenever a chain is finished, and check for cancellation in between
+        pending = futures
+        while pending:
+            done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+            check_cancelled(cancel)
+            if progress is not None and done:
+                progress(1 - len(pending) / num_workers)
+
+        # keep the order of the seeds, not the order of completion
+        samples = np.concatenate([future.result() for future in futures])
+    finally:
+        # on cancellation (or an error) the chains that wait are dropped and the running ones stop
+        # at their next check, so they do not keep the workers busy
+        for future in futures:
+            future.cancel()
+        stop.set()
+
+    return samples
+
+
+def MCMC_reference(D, A, a, B, b, num_iter=int(1e7), thinning=int(1e5), x0=None, rng=np.random, progress=None, cancel=None):
+    # the plain hit-and-run loop in the full D-space: one direction and two products with A per step.
+    # slow, but simple enough to check the other backends against
+    if x0 is None:
+        x0 = find_initial_point(A, a, B, b)
+
+    sample = construct_directions(B)
+    samples = np.zeros(shape=(len(range(0, num_iter, thinning)), D))
     samples[0, :] = x0
     xi = x0
-    
-    # show progress bar in flet UI
-    loading_bar = ft.ProgressBar()
-    page.add(loading_bar)
-    
-    for i in tqdm(range(num_iter - 1)):
-        xi = project_and_sample(xi, sample(), A, a)
-        samples[i + 1, :] = xi
-        
-        # update progress bar
-        if i % (num_iter // 100) == 0:
-            loading_bar.value = i/num_iter
-            sleep(0.01)
-            page.update()
-    sleep(0.3)
-    page.remove(loading_bar)
-    
-    return samples[0::thinning, :]
+    k = 1
+    for i in range(num_iter - 1):
+        xi = project_and_sample(xi, sample(rng), A, a, rng=rng)
+        if (i + 1) % thinning == 0:
+            samples[k, :] = xi
+            k += 1
+
+        if i % max(num_iter // 100, 1) == 0:
+            check_cancelled(cancel)
+            if progress is not None:
+                progress(i / num_iter)
+
+    return samples
+
+
+def _hit_and_run_kernel(x0, R, AR, A, a, c, y, d, u, first_step, thinning, out):
+    """
+    Runs len(u) hit-and-run steps of one chain in null-space coordinates, like NullSpaceWalk,
+    with explicit loops so that numba can compile it. d holds the scaled normal draws of the
+    directions and u the uniform draws of the steps. The state c (coordinates) and y (slack)
+    is updated in place, every thinning-th point is written to out. Returns the number of points.
+    Without numba it runs as plain (slow) Python, which is how the tests check it.
+    """
+    D, K = R.shape
+    m = AR.shape[0]
+    z = np.empty(m)
+    k = 0
+    for i in range(len(u)):
+        norm = 0.0
+        for l in range(K):
+            norm += d[i, l] * d[i, l]
+        norm = np.sqrt(norm)
+        if norm == 0:
+            norm = 1.0
+
+        # constraints projected onto the direction, and the tightest of them in both directions
+        lower = -np.inf
+        upper = np.inf
+        parallel = False
+        for j in range(m):
+            zj = 0.0
+            for l in range(K):
+                zj += AR[j, l] * d[i, l]
+            zj /= norm
+            z[j] = zj
+            if zj > 0:
+                upper = min(upper, -y[j] / zj)
+            elif zj < 0:
+                lower = max(lower, -y[j] / zj)
+            else:
+                parallel = True
+        if parallel:
+            upper = min(upper, 1.0)
+            lower = max(lower, 0.0)
+
+        t = lower + (upper - lower) * u[i]
+        for l in range(K):
+            c[l] += t * d[i, l] / norm
+        for j in range(m):
+            y[j] += t * z[j]
+
+        if (first_step + i + 1) % thinning == 0:
+            # build the point, and resync the slack so rounding errors do not add up
+            for p in range(D):
+                value = x0[p]
+                for l in range(K):
+                    value += R[p, l] * c[l]
+                out[k, p] = value
+            for j in range(m):
+                value = -a[j]
+                for p in range(D):
+                    value += A[j, p] * out[k, p]
+                y[j] = value
+            k += 1
+    return k
+
+
+@lru_cache(maxsize=None)
+def numba_kernel():
+    # numba is optional, without it the numba backend falls back to NumPy
+    try:
+        import numba
+    except ImportError:
+        logger.warning("numba is not installed, the numba sampler uses the numpy one")
+        return None
+    return numba.njit(cache=True)(_hit_and_run_kernel)
+
+
+def MCMC_kernel(kernel, D, A, a, B, b, num_iter=int(1e7), thinning=int(1e5), x0=None, rng=np.random, progress=None, cancel=None):
+    # runs a compiled kernel in blocks of 1% of the steps, the random numbers of a block are drawn up front
+    if x0 is None:
+        x0 = find_initial_point(A, a, B, b)
+
+    R, S = null_space_basis(B)
+    R = np.ascontiguousarray(R, dtype=float)
+    A = np.ascontiguousarray(A, dtype=float)
+    a = np.ascontiguousarray(a, dtype=float)
+    AR = A @ R
+    scale = np.sqrt(S)
+    x0 = np.asarray(x0, dtype=float)
+
+    samples = np.zeros(shape=(len(range(0, num_iter, thinning)), D))
+    samples[0, :] = x0
+    c = np.zeros(R.shape[1])
+    y = A @ x0 - a
+    k = 1
+    block = max(num_iter // 100, 1)
+    for first_step in range(0, num_iter - 1, block):
+        steps = min(block, num_iter - 1 - first_step)
+        d = scale * rng.standard_normal((steps, R.shape[1]))
+        u = rng.random(steps)
+        k += kernel(x0, R, AR, A, a, c, y, d, u, first_step, thinning, samples[k:])
+
+        check_cancelled(cancel)
+        if progress is not None:
+            progress((first_step + steps) / num_iter)
+
+    return samples
+
+
+def MCMC_numba(D, A, a, B, b, num_iter=int(1e7), thinning=int(1e5), x0=None, rng=np.random, progress=None, cancel=None):
+    kernel = numba_kernel()
+    if kernel is None:
+        return MCMC(D, A, a, B, b, num_iter=num_iter, thinning=thinning, x0=x0, rng=rng, progress=progress, cancel=cancel)
+    return MCMC_kernel(kernel, D, A, a, B, b, num_iter=num_iter, thinning=thinning, x0=x0, rng=rng, progress=progress, cancel=cancel)
+
+
+# single-chain samplers with the same arguments and output (the thinned samples, one row per sample)
+SAMPLERS = {
+    "reference": MCMC_reference,
+    "numpy": MCMC,
+    "numba": MCMC_numba,
+}
+
+
+def get_sampler(name):
+    if name not in SAMPLERS:
+        raise ValueError(f"unknown sampler {name!r}, expected one of {sorted(SAMPLERS)}")
+    return SAMPLERS[name]
 
 
 def acf(x, length=50):
-    return np.array([1] + [np.corrcoef(x[:-i], x[i:])[0, 1] for i in range(1, length)])
+    # autocorrelation for lags 0 .. length-1 of a chain x, either (n,) or (n, D) for every column at once.
+    # computed with the FFT, so all lags cost O(n log n) instead of one corrcoef per lag
+    x = np.asarray(x, dtype=float)
+    n = x.shape[0]
+    centered = x - np.mean(x, axis=0)
+    size = 2 ** int(np.ceil(np.log2(2 * n)))  # zero padding, so the correlation is not circular
+    f = np.fft.rfft(centered, n=size, axis=0)
+    cov = np.fft.irfft(f * np.conj(f), n=size, axis=0)[:min(length, n)]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return cov / cov[0]
 
 
-def output(samples, Zutaten, D, page: ft.Page ,recipe_name = ""):
+# given amounts stay fixed up to the rounding errors of the walk (about 1e-30), a column with at most this
+# variance relative to its squared mean counts as constant
+CONSTANT_VARIANCE = 1e-20
+
+
+def constant_columns(samples):
+    # columns of samples (n, D) without variance, up to rounding errors
+    return np.var(samples, axis=0) <= CONSTANT_VARIANCE * np.maximum(1, np.mean(samples, axis=0) ** 2)
+
+
+def effective_sample_size(chains):
+    """
+    Effective sample size of every column of chains, shaped (n, D) for one chain or
+    (num_chains, n, D). Uses Geyer's initial positive sequence on the autocorrelation
+    averaged over the chains. Columns without variance (given amounts) count all samples.
+    """
+    chains = np.asarray(chains, dtype=float)
+    if chains.ndim == 2:
+        chains = chains[None]
+    M, n, D = chains.shape
+
+    rho = np.mean([acf(chain, n) for chain in chains], axis=0)
+    # sums of neighbouring lags are positive for a reversible chain, until the noise takes over
+    pairs = rho[:2 * (n // 2)].reshape(n // 2, 2, D).sum(axis=1)
+    positive = np.cumprod(pairs > 0, axis=0).astype(bool)
+    tau = -1 + 2 * np.sum(np.where(positive, pairs, 0), axis=0)
+    tau = np.maximum(tau, 1 / np.log10(max(M * n, 10)))
+
+    ess = M * n / tau
+    ess[constant_columns(chains.reshape(-1, D))] = M * n
+    return ess
+
+
+def split_rhat(chains):
+    # potential scale reduction of chains (num_chains, n, D), with every chain split in two halves
+    chains = np.asarray(chains, dtype=float)
+    half = chains.shape[1] // 2
+    split = np.concatenate([chains[:, :half], chains[:, half:2 * half]])
+
+    W = np.mean(np.var(split, axis=1, ddof=1), axis=0)  # within-chain variance
+    B = half * np.var(np.mean(split, axis=1), axis=0, ddof=1)  # between-chain variance
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rhat = np.sqrt(((half - 1) / half * W + B / half) / W)
+    # within-chain variance of (numerically) constant columns, e.g. given amounts
+    rhat[W <= CONSTANT_VARIANCE * np.maximum(1, np.mean(split, axis=(0, 1)) ** 2)] = 1
+    return rhat
+
+
+def output(samples, Zutaten, D, recipe_name = ""):
+    # console report of a run, the flet output lives in WebInput.MainPage.output
     mean_sample = np.mean(samples, axis=0)
     std_sample = np.std(samples, axis=0)
 
-    if page:
-        page.add(ft.Text("Dish: " + recipe_name))
-        page.add(ft.Text(f"{D} ingredients in total"))
-        page.add(ft.Text("=" * 66))
-        for i, zutat in enumerate(Zutaten):
-            page.add(ft.Text("{:>42}".format(zutat) + f": {mean_sample[i] * 100:5.2g}% +/- {2*std_sample[i] * 100:4.2f}%"))
-        page.add(ft.Text("=" * 66))
-    
     print(f"MCMC predictions from {samples.shape[0]:d} (thinned) samples:")
     print("Dish: ", recipe_name)
     print(f"{D} ingredients in total")
@@ -0,0 +1,54 @@
+import asyncio
+import json
+import os 
+import sys 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+from ApiServer import EstimationServer
+
+#run locally with: python -m pytest
+#theres a github workflow too
+
+async def request(port, method, path, body=None):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    payload = json.dumps(body).encode() if body is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(payload)}\r\n\r\n".encode() + payload)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, content = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(content)
+
+
+#tests the estimation endpoint and the error responses
+def test_api_server():
+    async def run():
+        server = EstimationServer(workers=1, queue_size=2, timeout=30)
+        tcp_server = await server.start("127.0.0.1", 0)
+        port = tcp_server.sockets[0].getsockname()[1]
+        try:
+            health = await request(port, "GET", "/health")
+            estimate = await request(port, "POST", "/estimate", {"ingredients": ["Basil", "Oil", "Nuts", "Salt"], "amounts": [40, None, None, 1.5]})
+            missing = await request(port, "GET", "/unknown")
+            invalid = await request(port, "POST", "/estimate", {"ingredients": ["Basil"], "amounts": [40, 10]})
+            infeasible = await request(port, "POST", "/estimate", {"ingredients": ["Basil", "Oil"], "amounts": [10, 40]})
+            wrong_types = [
+                await request(port, "POST", "/estimate", {"ingredients": 5}),
+                await request(port, "POST", "/estimate", {"ingredients": ["Basil", "Oil"], "nutrients": [1, 2]}),
+                await request(port, "POST", "/estimate", {"ingredients": ["Basil", "Oil"], "nutrients": 5}),
+            ]
+        finally:
+            await server.stop()
+        return health, estimate, missing, invalid, infeasible, wrong_types
+
+    health, estimate, missing, invalid, infeasible, wrong_types = asyncio.run(run())
+
+    #ensure the server answers with JSON
+    assert health == (200, {"status": "ok", "queued": 0, "queued_recipes": 0}), "health check should report empty queues"
+    status, result = estimate
+    assert status == 200, "valid labels should be estimated"
+    assert abs(sum(result["mean"]) - 1) < 1e-9 and result["num_samples"] > 0, "estimate should sum to 1"
+    #ensure errors get their status codes
+    assert missing[0] == 404, "unknown paths should give 404"
+    assert invalid[0] == 400, "lists of different length should give 400"
+    assert infeasible[0] == 422 and "order" in infeasible[1]["error"], "infeasible labels should give 422 with the reason"
+    assert [status for status, _ in wrong_types] == [400, 400, 400], "fields of the wrong type should give 400"
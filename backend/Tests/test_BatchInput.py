@@ -0,0 +1,49 @@
+import json
+import os 
+import sys 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+from BatchInput import parse_amount, split_ingredient, read_recipes, run_batch
+from data.DataManager import load_data
+
+#run locally with: python -m pytest
+#theres a github workflow too
+
+#tests reading recipes in the layout of data/ingredients.csv
+def test_read_csv(tmp_path):
+    path = tmp_path / "recipes.csv"
+    path.write_text(
+        "1,2,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,carbs,fat,protein,salt,fiber,sugar,recipe\n"
+        "Sugar:50,Flour,Salt:1,,,,,,,,,,,,,,,,,,,,,0.5,,,Cookies\n"
+    )
+
+    recipes = list(read_recipes(path))
+
+    #ensure the numbered columns become the ingredients, in order
+    assert recipes == [("Cookies", [("Sugar", "50"), ("Flour", ""), ("Salt", "1")], ["", "", "", "0.5", "", ""])]
+    #ensure amounts are converted from % and empty cells are unknown
+    assert split_ingredient(" Basil :40") == ("Basil", "40"), "whitespace around the name should be ignored"
+    assert parse_amount(" 40 ") == 0.4 and parse_amount("") is None, "amounts should be converted from %"
+
+
+#tests that every recipe gets one result line
+def test_run_batch(tmp_path):
+    input_path = tmp_path / "recipes.jsonl"
+    output_path = tmp_path / "results.jsonl"
+    input_path.write_text(
+        json.dumps({"recipe": "Pesto", "ingredients": [{"name": "Basil", "amount": 40}, {"name": "Oil"}, {"name": "Nuts"}, "Salt:1.5"]}) + "\n"
+        + json.dumps({"recipe": "Broken", "ingredients": ["Sugar:abc"]}) + "\n"
+    )
+
+    done_count, failed_count = run_batch(input_path, output_path, workers=1, history_path=tmp_path / "history.sqlite")
+    results = sorted((json.loads(line) for line in output_path.read_text().splitlines()), key=lambda result: result["index"])
+
+    #ensure the results are written and errors do not stop the batch
+    assert (done_count, failed_count) == (2, 1), "both recipes should be processed"
+    assert results[0]["recipe"] == "Pesto" and results[0]["error"] is None, "first recipe should be estimated"
+    assert abs(sum(results[0]["mean"]) - 1) < 1e-9, "estimated amounts should sum to 1"
+    assert results[1]["error"] is not None, "invalid amounts should be reported"
+    #ensure the estimates are added to the history in fractions, failed ones are not
+    history = load_data(tmp_path / "history.sqlite")
+    assert list(history["recipe"]) == ["Pesto"] * 4, "only the estimated recipe should be saved"
+    assert history["amount"][0] == 0.4 and history["amount"].isna()[1], "given amounts should be saved as fractions"
+    assert abs(history["mean"].sum() - 1) < 1e-9, "the estimated amounts should be saved"
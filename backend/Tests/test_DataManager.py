@@ -0,0 +1,45 @@
+import numpy as np
+import os 
+import sys 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+from data.DataManager import entry, save_data, save_many, load_data, find_recipe, import_csv
+
+#run locally with: python -m pytest
+#theres a github workflow too
+
+#tests that saved estimates are found again by recipe name
+def test_history(tmp_path):
+    path = tmp_path / "history.sqlite"
+    Ingredients = [f"Ingredient {i}" for i in range(25)]
+    samples = np.random.rand(100, 25)
+
+    assert load_data(path) is None, "missing history should load as None"
+    save_data(Ingredients, [None] * 6, "Soup", [0.5] + [None] * 24, samples, path)
+    save_many([entry(["Sugar", "Salt"], [1, 0, 0, 0.5, 0, 1], f"Recipe {i}") for i in range(100)], path)
+
+    #ensure there is no limit on the number of ingredients and the caller's list is unchanged
+    assert len(Ingredients) == 25, "the caller's list should not be changed"
+    soup = find_recipe("Soup", path)
+    assert list(soup["name"]) == Ingredients, "all ingredients should be saved in order"
+    #ensure the summary of the samples is stored with the inputs
+    assert np.allclose(soup["mean"], samples.mean(axis=0)) and np.allclose(soup["std"], samples.std(axis=0)), "mean and std should be saved"
+    assert soup["amount"][0] == 0.5 and np.isnan(soup["amount"][1]), "given amounts should be saved"
+    assert soup["num_samples"][0] == 100, "number of samples should be saved"
+    #ensure all entries of the batch were written
+    assert len(load_data(path)) == 25 + 2 * 100, "one row per ingredient"
+    assert find_recipe("Recipe 7", path)["salt"].tolist() == [0.5, 0.5], "nutritional values should be saved"
+
+
+#tests importing the old csv layout
+def test_import_csv(tmp_path):
+    csv_path = tmp_path / "ingredients.csv"
+    header = ",".join([str(i) for i in range(1, 21)] + ["carbs", "fat", "protein", "salt", "fiber", "sugar", "recipe"])
+    csv_path.write_text(header + "\nSugar:60,Salt" + "," * 18 + ",60,0,0,1.5,0,,test\n", encoding="utf-8")
+
+    #ensure every row becomes an entry with its ingredients
+    assert import_csv(csv_path, tmp_path / "history.sqlite") == 1, "one entry per row"
+    test = find_recipe("test", tmp_path / "history.sqlite")
+    assert list(test["name"]) == ["Sugar", "Salt"], "empty columns should be dropped"
+    #ensure the values in % are saved as fractions like the estimates
+    assert test["amount"][0] == 0.6 and test["amount"].isna()[1], "given amounts should be converted from %"
+    assert test["carbs"][0] == 0.6 and test["salt"][0] == 0.015 and test["sugar"].isna()[0], "nutrients should be converted from %"
@@ -0,0 +1,33 @@
+import numpy as np
+import os 
+import sys 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+from backend.Feasibility import check, fill_bounds
+
+#run locally with: python -m pytest
+#theres a github workflow too
+
+#tests the smallest and largest totals of labels with missing amounts
+def test_fill_bounds():
+    lowest, highest = fill_bounds([None, 0.4, None, None, 0.1, None])
+
+    #ensure the gaps are filled with the next given amount (lowest) and the previous one (highest)
+    assert np.allclose(lowest, [0.4, 0.4, 0.1, 0.1, 0.1, 0]), "gaps should take the next given amount"
+    assert np.isinf(highest[0]) and np.allclose(highest[1:], [0.4, 0.4, 0.4, 0.1, 0.1]), "gaps should take the previous given amount"
+
+
+#tests the structured reasons for labels that can not be estimated
+def test_check():
+    ingredients = ["Flour", "Sugar", "Butter"]
+
+    #ensure valid labels pass and sums are compared with a tolerance
+    assert check(ingredients, [0.5, None, 0.1]).reason == "ok", "valid label should pass"
+    assert check(ingredients, [0.7, 0.2, 0.1]), "0.7 + 0.2 + 0.1 should count as 100%"
+    #ensure every failed check has its own reason
+    assert check(["Flour", "Flour", "Butter"], [0.5, None, 0.1]).reason == "duplicate_names", "repeated names should be found"
+    assert check(ingredients, [0.1, 0.5, None]).reason == "not_ordered", "increasing amounts should be rejected"
+    assert check(ingredients, [0.5, 0.3, 0.1]).reason == "sum_not_one", "given amounts should sum to 100%"
+    assert check(ingredients, [0.6, None, 0.3]).reason == "over_total", "smallest total over 100% should be rejected"
+    result = check(ingredients, [0.3, None, 0.1])
+    assert result.reason == "under_total" and np.isclose(result.max_total, 0.7), "largest total under 100% should be rejected"
+    assert not result and result.message, "infeasible labels should be falsy and explain why"
@@ -0,0 +1,94 @@
+import logging
+import numpy as np
+import pytest
+import os 
+import sys 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+import backend.Input as Input
+from backend.Input import constraintMatrices, cache_info, sampleSimplexSlice, createMatrices, nutrientConstraints
+
+#run locally with: python -m pytest
+#theres a github workflow too
+
+#tests that the constraint geometry is cached per ingredient count and fixed-amount pattern
+def test_constraintMatrices_cache():
+    D = 5
+    fixed = (True, False, False, True, False)
+
+    A, a, B = constraintMatrices(D, fixed)
+    misses = cache_info()["matrices"].misses
+    A2, a2, B2 = constraintMatrices(D, fixed)
+
+    #ensure the second call is served from the cache
+    assert cache_info()["matrices"].misses == misses, "same pattern should not rebuild the matrices"
+    assert A2 is A and B2 is B, "cached matrices should be reused"
+    #ensure the cached matrices cannot be changed by a caller
+    assert not B.flags.writeable, "cached matrices should be read-only"
+    #ensure the equalities are the sum row and one row per given amount
+    assert B.shape == (3, D), "one sum row and one row per given amount"
+    assert np.array_equal(B[0], np.ones(D)), "first row should sum all amounts"
+    assert np.array_equal(np.sort(np.nonzero(B[1:])[1]), [0, 3]), "fixed positions should get a row"
+
+
+#tests the exact sampler for two unknowns between given amounts
+def test_sampleSimplexSlice():
+    givenAmounts = [0.5, None, None, 0.05]
+
+    samples = sampleSimplexSlice(givenAmounts, num_samples=2000, rng=np.random.default_rng(0))
+
+    #ensure all samples are valid amounts
+    assert samples.shape == (2000, 4), "one row per sample"
+    assert np.allclose(samples.sum(axis=1), 1), "amounts should sum to 1"
+    assert np.all(np.diff(samples, axis=1) <= 1e-12), "amounts should be non-increasing"
+    #ensure the given amounts are kept
+    assert np.all(samples[:, 0] == 0.5) and np.all(samples[:, 3] == 0.05), "given amounts should not change"
+    #ensure the second amount is uniform on [0.225, 0.4], so its mean is 0.3125
+    assert np.isclose(samples[:, 1].mean(), 0.3125, atol=0.01), "mean should match the exact value"
+    #ensure labels without a single run of few unknowns fall back to the MCMC
+    assert sampleSimplexSlice([None, 0.5, None, 0.1, None]) is None, "separate unknowns are not handled"
+
+
+#tests that declared nutrition facts restrict the samples to amounts with a matching nutrient content
+def test_createMatrices_nutrients():
+    Ingredients = ["Sugar", "Hazelnuts", "Oil"]
+    givenAmounts = [None, None, None]
+    Nutrients = [None, 0.1, None, None, None, None]  # 10 g fat per 100 g
+    table = [[0, 0, 0, 0, 0, 0], [0.1, 0.6, 0.15, 0, 0.1, 0.04], [0, 1, 0, 0, 0, 0]]
+
+    N, n = nutrientConstraints(Nutrients, table)
+    #ensure the fat content gets an upper and a lower bound with the tolerance
+    assert N.shape == (2, 3), "one upper and one lower bound row"
+    assert np.allclose(n, [0.12, -0.08]), "bounds should be value +- tolerance"
+
+    np.random.seed(0)
+    samples = createMatrices(Ingredients, givenAmounts, Nutrients, table)
+    fat = samples @ np.array(table)[:, 1]
+    #ensure every sample has the declared fat content and is still a valid recipe
+    assert np.all((fat <= 0.12 + 1e-9) & (fat >= 0.08 - 1e-9)), "samples should match the nutrition facts"
+    assert np.allclose(samples.sum(axis=1), 1), "amounts should sum to 1"
+    assert np.all(np.diff(samples, axis=1) <= 1e-9), "amounts should be non-increasing"
+
+    #ensure an unknown content only gives the upper bound, and impossible facts fall back to the amounts alone
+    assert nutrientConstraints(Nutrients, [table[0], None, table[2]])[0].shape == (1, 3), "only the upper bound holds"
+    samples = createMatrices(Ingredients, givenAmounts, [None, 0.9, None, None, None, None], table)
+    assert np.allclose(samples.sum(axis=1), 1), "infeasible nutrition facts should be ignored"
+
+
+#tests that labels with determined amounts are checked against the nutrition facts and that only infeasibility falls back
+def test_createMatrices_nutrients_fallback(caplog, monkeypatch):
+    Ingredients = ["Sugar", "Hazelnuts", "Oil"]
+    table = [[0, 0, 0, 0, 0, 0], [0.1, 0.6, 0.15, 0, 0.1, 0.04], [0, 1, 0, 0, 0, 0]]
+    fatty = [None, 0.05, None, None, None, None]
+
+    #ensure determined amounts are returned, with a warning if the nutrition facts do not fit them
+    with caplog.at_level(logging.WARNING, logger="backend.Input"):
+        samples = createMatrices(Ingredients, [0.5, 0.3, None], fatty, table)
+    assert np.allclose(samples, [[0.5, 0.3, 0.2]]), "determined amounts should be returned"
+    assert "do not fit" in caplog.text, "nutrition facts that do not fit should be reported"
+
+    #ensure other errors of the sampler are not mistaken for infeasible nutrition facts
+    def broken(*args, **kwargs):
+        raise ValueError("broken sampler")
+    monkeypatch.setattr(Input.MainCode, "execute_mcmc", broken)
+    with pytest.raises(ValueError, match="broken sampler"):
+        createMatrices(Ingredients, [None, None, None], fatty, table)
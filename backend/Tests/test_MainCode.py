@@ -1,8 +1,13 @@
 import numpy as np
+import threading
+import time
+import pytest
 import os 
 import sys 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-from MainCode import find_initial_point,construct_directions
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+from backend.Input import labelConstraints
+from MainCode import find_initial_point,construct_directions,is_ordered_simplex,step_bounds,MCMC_chains,MCMC_parallel,MCMC,RunningMoments,summarize_MCMC,ordered_interior_point,chebyshev_center,SamplingCancelled,execute_mcmc,acf,effective_sample_size,split_rhat,MCMC_adaptive,NullSpaceWalk,project_and_sample,SAMPLERS,get_sampler,MCMC_kernel,_hit_and_run_kernel,constant_columns,implicit_equalities
 
 #run locally with: python -m pytest
 #theres a github workflow too
@@ -57,11 +62,311 @@ def test_construct_directions():
     #ensure direction is one-dimensional
     assert np.ndim(direction) == 1, "direction must be one-dimensional"
     #ensure that if Bx-b=0 , B(x+du) = 0 for all d
-    assert np.allclose(B @ direction, 0), "Product of B and direction should be close to 0" 
+    assert np.allclose(B @ direction, 0), "Product of B and direction should be close to 0"
 
 
+#tests the detection of the constraints of Input.createMatrices
+def test_is_ordered_simplex():
+    D = 8
+    A, a, _, _ = labelConstraints([None] * D)
+
+    #ensure the structure is detected
+    assert is_ordered_simplex(A, a), "constraints of createMatrices should be detected"
+    #ensure other constraints are not detected
+    assert not is_ordered_simplex(A[:-1], a[:-1]), "missing rows should not be detected"
+
+
+#tests step_bounds against the loop over all constraints
+def test_step_bounds():
+    y = np.array([-0.5, -0.2, -0.1, -0.3, -0.4])
+    z = np.array([0.3, -0.6, 0.0, 0.2, -0.1])
+
+    upper = np.inf
+    lower = -np.inf
+    for k in range(len(y)):
+        if z[k] > 0:
+            upper = np.minimum(upper, -y[k] / z[k])
+        elif z[k] < 0:
+            lower = np.maximum(lower, -y[k] / z[k])
+        else:
+            upper = np.minimum(upper, 1)
+            lower = np.maximum(lower, 0)
+
+    #ensure the vectorized bounds match the loop
+    assert np.allclose(step_bounds(y, z), (lower, upper)), "bounds should match the loop"
+
+
+#tests the batched sampler
+def test_MCMC_chains():
+    D = 5
+    A, a, B, b = labelConstraints([None, 0.2, None, None, None])
+
+    samples = MCMC_chains(D, A, a, B, b, num_chains=4, num_iter=50, thinning=10)
+
+    #ensure every chain contributes its thinned samples
+    assert samples.shape == (20, D), "samples should have shape (num_chains * num_iter / thinning, D)"
+    #ensure all samples are inside the polytope
+    assert np.all(samples @ A.T - a <= 1e-12), "samples should satisfy the inequalities"
+    assert np.allclose(samples @ B.T, b), "samples should satisfy the equalities"
+
+
+#the exact means of the uniform distribution on the ordered simplex x1 >= ... >= xD >= 0, sum x = 1
+def ordered_simplex_means(D):
+    return np.array([sum(1 / k for k in range(i, D + 1)) / D for i in range(1, D + 1)])
+
+
+#tests that many short chains are not biased towards their start point
+def test_MCMC_chains_means():
+    D = 10
+    A, a, B, b = labelConstraints([None] * D)
+
+    samples = MCMC_chains(D, A, a, B, b, num_chains=100, num_iter=100, thinning=1, burn_in=5000, rng=np.random.default_rng(0))
+
+    #ensure the means match the exact ones (without the burn-in the error is about 0.14)
+    assert np.allclose(np.mean(samples, axis=0), ordered_simplex_means(D), atol=0.03), "the chains should sample the uniform distribution"
+
+
+#tests the process pool of independent chains
+def test_MCMC_parallel():
+    D = 4
+    A, a, B, b = labelConstraints([None] * D)
+
+    samples = MCMC_parallel(D, A, a, B, b, num_workers=2, num_iter=200, thinning=20, seed=42)
+    repeated = MCMC_parallel(D, A, a, B, b, num_workers=2, num_iter=200, thinning=20, seed=42)
+
+    #ensure the thinned samples of all workers are merged
+    assert samples.shape == (10, D), "samples of both workers should be merged"
+    #ensure the per-worker seeds make runs reproducible
+    assert np.array_equal(samples, repeated), "runs with the same seed should give the same samples"
+    #ensure all samples are inside the polytope
+    assert np.all(samples @ A.T - a <= 1e-12), "samples should satisfy the inequalities"
+    assert np.allclose(samples @ B.T, b), "samples should satisfy the equalities"
+
+
+#tests that the workers do not report the neighbourhood of their start point
+def test_MCMC_parallel_means():
+    D = 10
+    A, a, B, b = labelConstraints([None] * D)
+
+    samples = MCMC_parallel(D, A, a, B, b, num_workers=8, num_iter=8000, thinning=10, burn_in=5000, seed=0)
+
+    #ensure the means match the exact ones
+    assert np.allclose(np.mean(samples, axis=0), ordered_simplex_means(D), atol=0.04), "the chains should sample the uniform distribution"
+
+
+#tests that a cancelled parallel run stops its workers, so the shared pool is free for the next run
+def test_MCMC_parallel_cancel():
+    D = 4
+    A, a, B, b = labelConstraints([None] * D)
+
+    cancel = threading.Event()
+    timer = threading.Timer(0.5, cancel.set)
+    timer.start()
+    #ensure the run is cancelled long before its chains would be done
+    with pytest.raises(SamplingCancelled):
+        MCMC_parallel(D, A, a, B, b, num_workers=2, num_iter=int(4e6), thinning=1000, seed=1, cancel=cancel)
+
+    start = time.perf_counter()
+    samples = MCMC_parallel(D, A, a, B, b, num_workers=2, num_iter=200, thinning=20, seed=1)
+    #ensure the next run does not wait for the cancelled chains
+    assert samples.shape == (10, D), "the next run should use the same pool"
+    assert time.perf_counter() - start < 20, "cancelled chains should stop in the workers"
+
+
+#tests that the streaming sampler keeps only the thinned samples and that Welford's method matches numpy
+def test_streaming_MCMC():
+    D = 4
+    A, a, B, b = labelConstraints([None] * D)
+    x0 = np.array([0.4, 0.3, 0.2, 0.1])
+
+    samples = MCMC(D, A, a, B, b, num_iter=1000, thinning=10, x0=x0, rng=np.random.default_rng(0))
+    moments = summarize_MCMC(A, a, B, b, x0, num_iter=1000, thinning=10, rng=np.random.default_rng(0))
+
+    #ensure the same thinned rows are kept as with samples[0::thinning]
+    assert samples.shape == (100, D), "only every thinning-th step should be kept"
+    assert np.array_equal(samples[0], x0), "the first sample should be the initial point"
+    #ensure the running moments match the stored samples
+    assert moments.count == 100, "every thinned sample should be counted"
+    assert np.allclose(moments.mean, np.mean(samples, axis=0)), "running mean should match np.mean"
+    assert np.allclose(moments.std, np.std(samples, axis=0)), "running std should match np.std"
+
+
+#tests the constructed initial point against the linear program for general constraints
+def test_interior_points():
+    D = 6
+    # the leading and the last amount unknown
+    A, a, B, b = labelConstraints([None, None, 0.2, None, 0.05, None])
+
+    x0 = ordered_interior_point(A, a, B, b)
+    x1 = chebyshev_center(np.vstack([A, np.eye(D)[:1]]), np.append(a, 0.5), B, b)
 
+    #ensure both points are strictly inside the polytope
+    assert np.all(A @ x0 - a < 0) and np.allclose(B @ x0, b), "constructed point should be strictly interior"
+    assert np.all(A @ x1 - a < 0) and np.allclose(B @ x1, b), "chebyshev center should be strictly interior"
+    assert x1[0] < 0.5, "chebyshev center should satisfy the extra constraint"
+    #ensure other constraints are left to the linear program
+    assert ordered_interior_point(A[:-1], a[:-1], B, b) is None, "only the ordered simplex is constructed"
+
+
+#tests labels with two equal given amounts next to each other, e.g. "salt 0.5%, spice 0.5%"
+def test_equal_given_amounts():
+    for givenAmounts in ([None, 0.1, 0.1, None, None], [0.5, None, None, None, None, 0.01, 0.01]):
+        D = len(givenAmounts)
+        A, a, B, b = labelConstraints(givenAmounts)
+        x0 = ordered_interior_point(A, a, B, b)
+        x1 = chebyshev_center(A, a, B, b)
+        free = ~implicit_equalities(A, B)
+
+        #ensure the ordering row between the equal amounts is an implicit equality, the other orderings are not
+        equal = [i for i in range(D - 1) if givenAmounts[i] is not None and givenAmounts[i] == givenAmounts[i + 1]]
+        ordering = free[D:2 * D - 1]
+        assert np.all(~ordering[equal]) and np.sum(~ordering) == len(equal), "only the ordering of the equal amounts should be an implicit equality"
+        #ensure both initial points are strictly inside the other constraints
+        for x in (x0, x1):
+            assert np.all((A @ x - a)[free] < 0) and np.all((A @ x - a)[~free] <= 1e-9), "initial point should be interior"
+            assert np.allclose(B @ x, b), "initial point should satisfy the equalities"
+
+        samples = MCMC(D, A, a, B, b, num_iter=2000, thinning=10, rng=np.random.default_rng(0))
+        #ensure the chain moves and stays inside the polytope
+        assert np.all(samples @ A.T - a <= 1e-9) and np.allclose(samples @ B.T, b), "samples should satisfy the constraints"
+        assert np.all(np.std(samples[:, [g is None for g in givenAmounts]], axis=0) > 0), "the unknown amounts should vary"
+
+
+#tests that a set cancel event stops the sampler
+def test_MCMC_cancel():
+    D = 3
+    A, a, B, b = labelConstraints([None] * D)
+
+    cancel = threading.Event()
+    cancel.set()
+
+    #ensure the sampling loops stop once the event is set
+    with pytest.raises(SamplingCancelled):
+        MCMC(D, A, a, B, b, num_iter=1000, thinning=10, cancel=cancel)
+    with pytest.raises(SamplingCancelled):
+        MCMC_chains(D, A, a, B, b, num_chains=2, num_iter=1000, thinning=10, cancel=cancel)
+
+
+#tests the headless sampler API with a progress callable
+def test_execute_mcmc():
+    D = 4
+    A, a, B, b = labelConstraints([None] * D)
+
+    reported = []
+    result = execute_mcmc(["a", "b", "c", "d"], A, a, B, b, progress=reported.append)
+
+    #ensure the result object holds the thinned samples and their summary
+    assert result.samples.shape == (100, D), "100 thinned samples should be returned"
+    assert np.allclose(result.mean, np.mean(result.samples, axis=0)), "mean should match the samples"
+    assert np.allclose(result.std, np.std(result.samples, axis=0)), "std should match the samples"
+    #ensure progress is reported as increasing fractions
+    assert len(reported) > 0 and all(0 <= value < 1 for value in reported), "progress should be a fraction"
+    assert reported == sorted(reported), "progress should not go backwards"
+
+
+#tests that many short chains still keep samples
+def test_execute_mcmc_many_chains():
+    D = 4
+    A, a, B, b = labelConstraints([None] * D)
+
+    result = execute_mcmc(["a", "b", "c", "d"], A, a, B, b, num_chains=200)
+
+    #ensure every chain contributes samples and the summary is finite
+    assert result.samples.shape[0] >= 200, "every chain should keep samples"
+    assert np.all(np.isfinite(result.mean)) and np.isclose(np.sum(result.mean), 1), "mean should be a valid estimate"
+
+
+#tests the convergence diagnostics on chains with known autocorrelation
+def test_convergence_diagnostics():
+    rng = np.random.default_rng(0)
+    n = 4000
+
+    # AR(1) chain with correlation 0.9 between neighbours, so the acf is 0.9^k and ESS is about n / 19
+    x = np.zeros(n)
+    for i in range(1, n):
+        x[i] = 0.9 * x[i - 1] + rng.standard_normal()
+    independent = rng.standard_normal((4, n, 2))
+
+    #ensure the vectorized acf follows the known decay
+    assert np.allclose(acf(x, 5), 0.9 ** np.arange(5), atol=0.05), "acf should decay like 0.9^k"
+    assert acf(independent[0], 10).shape == (10, 2), "acf should work on every column at once"
+    #ensure the effective sample size reflects the autocorrelation
+    assert 100 < effective_sample_size(x[:, None])[0] < 400, "ESS of the AR(1) chain should be about n / 19"
+    assert np.all(effective_sample_size(independent) > 0.8 * 4 * n), "independent samples should all count"
+    #ensure R-hat detects chains that did not mix
+    assert np.all(split_rhat(independent) < 1.01), "mixed chains should have R-hat close to 1"
+    assert np.all(split_rhat(independent + np.arange(4)[:, None, None]) > 1.1), "shifted chains should have large R-hat"
+
+
+#tests that given amounts count as constant although the walk leaves rounding noise in them
+def test_diagnostics_fixed_amount():
+    D = 5
+    A, a, B, b = labelConstraints([0.3, None, None, None, None])
+    samples = MCMC(D, A, a, B, b, num_iter=20000, thinning=10, rng=np.random.default_rng(0))
+
+    #ensure only the given amount is detected as constant
+    assert list(constant_columns(samples)) == [True, False, False, False, False], "only the given amount should be constant"
+    #ensure it counts all samples and does not look unmixed
+    assert effective_sample_size(samples)[0] == len(samples), "a given amount should count all samples"
+    assert np.all(effective_sample_size(samples)[1:] < len(samples)), "free amounts should be autocorrelated"
+    assert split_rhat(samples.reshape(2, -1, D))[0] == 1, "a given amount should have R-hat 1"
+
+
+#tests that the adaptive sampler stops once the target tolerance is reached
+def test_MCMC_adaptive():
+    D = 3
+    A, a, B, b = labelConstraints([None] * D)
+
+    rng = np.random.default_rng(1)
+    loose, loose_steps = MCMC_adaptive(D, A, a, B, b, tolerance=0.05, max_iter=int(1e5), rng=rng)
+    capped, capped_steps = MCMC_adaptive(D, A, a, B, b, tolerance=1e-9, block=500, max_iter=2000, rng=rng)
+
+    #ensure easy targets stop early and impossible ones stop at max_iter
+    assert loose_steps < 4 * int(1e5), "a loose tolerance should stop before max_iter"
+    assert capped_steps == 4 * 2000, "an unreachable tolerance should stop at max_iter"
+    assert capped.shape == (4 * 1500 // 10, D), "burn-in should be discarded"
+    assert np.allclose(loose.sum(axis=1), 1), "samples should satisfy the equalities"
+
+
+#tests that the walk in null-space coordinates takes the same steps as the walk in the full space
+def test_NullSpaceWalk():
+    D = 6
+    A, a, B, b = labelConstraints([None, None, 0.15, None, None, None])
+    x0 = find_initial_point(A, a, B, b)
+
+    walk = NullSpaceWalk(A, a, B, x0)
+    sample = construct_directions(B)
+    rng_walk = np.random.default_rng(3)
+    rng_full = np.random.default_rng(3)
+    xi = x0
+    for _ in range(200):
+        walk.step(rng_walk)
+        xi = project_and_sample(xi, sample(rng_full), A, a, rng=rng_full)
+
+    #ensure both walks end at the same point and the given amount is unchanged
+    assert np.allclose(walk.points()[0], xi), "null-space walk should match project_and_sample"
+    assert walk.points()[0][2] == 0.15, "the fixed amount should stay exact"
+
+
+#tests that all sampler backends sample the same distribution with the same output format
+def test_sampler_backends():
+    D = 6
+    A, a, B, b = labelConstraints([None, None, 0.15, None, None, None])
+    x0 = find_initial_point(A, a, B, b)
 
+    results = {name: get_sampler(name)(D, A, a, B, b, num_iter=20000, thinning=10, x0=x0, rng=np.random.default_rng(1)) for name in SAMPLERS}
+    # the kernel of the numba backend, run as plain Python
+    results["kernel"] = MCMC_kernel(_hit_and_run_kernel, D, A, a, B, b, num_iter=20000, thinning=10, x0=x0, rng=np.random.default_rng(1))
 
+    reference = results["reference"]
+    for name, samples in results.items():
+        #ensure the same number of samples and valid points
+        assert samples.shape == reference.shape, f"{name} should return one row per thinned step"
+        assert np.all(samples @ A.T - a <= 1e-9) and np.allclose(samples @ B.T, b), f"{name} samples should satisfy the constraints"
+        #ensure the backends agree on the mean
+        assert np.allclose(samples.mean(axis=0), reference.mean(axis=0), atol=0.02), f"{name} should match the reference sampler"
 
+    #ensure unknown backends are rejected
+    with pytest.raises(ValueError):
+        get_sampler("cuda")
 
@@ -0,0 +1,46 @@
+import gc
+import weakref
+import numpy as np
+import os 
+import sys 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+from data.NutrientDatabase import load_database, normalize, read_database
+
+#run locally with: python -m pytest
+#theres a github workflow too
+
+#tests the lookup of ingredient names as they appear on labels
+def test_lookup():
+    database = load_database()
+
+    #ensure the normalized, alias and misspelled names find the same profile
+    assert normalize(" Gek. Linsen (35%)") == "gek linsen", "case, punctuation and amounts should be removed"
+    assert database.lookup("Salz") == database.lookup("salt"), "aliases should find the ingredient"
+    assert database.lookup("Haselnusse") == database.lookup("hazelnuts"), "misspellings should be matched fuzzily"
+    assert database.lookup("Unobtainium") is None, "unknown ingredients should not be matched"
+
+    #ensure the profiles are fractions like the amounts and shared read-only
+    assert np.isclose(database.nutrients("Salt")[3], 1), "salt should be 100 g salt per 100 g"
+    assert not database.table.flags.writeable, "the shared table should be read-only"
+    assert load_database() is database, "the database should be loaded once per process"
+    table = database.nutrient_table(["Sugar", "Unobtainium"])
+    assert table[1] is None and np.isclose(table[0][5], 1), "one row per ingredient, None if unknown"
+
+
+#tests that aliases do not shadow the names of other ingredients
+def test_read_database(tmp_path):
+    path = tmp_path / "nutrients.csv"
+    path.write_text("name,aliases,carbs,fat,protein,salt,fiber,sugar\noil,,0,100,0,0,0,0\nolive oil,oil,0,100,0,0,0,0\n", encoding="utf-8")
+
+    database = read_database(path)
+
+    #ensure the name of an ingredient wins over an alias of another one
+    assert database.names[database.lookup("Oil")] == "oil", "names should win over aliases"
+    assert database.table.shape == (2, 6), "one row per ingredient"
+
+    #ensure the cache of the fuzzy matches does not keep the database alive
+    assert database.lookup("olive oyl") == database.lookup("olive oil"), "misspellings should be matched fuzzily"
+    reference = weakref.ref(database)
+    del database
+    gc.collect()
+    assert reference() is None, "databases should be freed once they are not used"
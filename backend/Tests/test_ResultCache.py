@@ -0,0 +1,52 @@
+import numpy as np
+import os 
+import sys 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+import data.ResultCache as ResultCache
+from data.ResultCache import cache_key, load_result, save_result
+
+#run locally with: python -m pytest
+#theres a github workflow too
+
+#tests that a saved result is found again for the same query
+def test_result_cache(tmp_path):
+    samples = np.random.rand(100, 3)
+
+    assert load_result(["Sugar", "Flour", "Salt"], [0.5, None, 0.01], tmp_path) is None, "empty cache should miss"
+    save_result(["Sugar", "Flour", "Salt"], [0.5, None, 0.01], samples, tmp_path)
+    result = load_result([" sugar", "Flour ", "SALT"], [0.5, None, 0.01], tmp_path)
+
+    #ensure the canonical key ignores whitespace and case of the names
+    assert result is not None, "same ingredients and amounts should hit the cache"
+    assert np.array_equal(result["samples"], samples), "samples should be stored unchanged"
+    assert np.allclose(result["mean"], np.mean(samples, axis=0)), "mean should be stored"
+    #ensure different amounts give a different key
+    assert cache_key(["Sugar"], [0.5]) != cache_key(["Sugar"], [0.6]), "amounts should be part of the key"
+    assert cache_key(["Sugar"], [0.5]) != cache_key(["Sugar"], [0.5], [0.1, None]), "nutrients should be part of the key"
+
+
+#tests that results of other sampler settings are not served
+def test_result_cache_settings(tmp_path, monkeypatch):
+    save_result(["Sugar", "Flour"], [None, None], np.ones((2, 2)), tmp_path)
+    monkeypatch.setattr(ResultCache.MainCode, "DEFAULT_SAMPLER", "reference")
+
+    #ensure a changed sampler backend misses the cache
+    assert load_result(["Sugar", "Flour"], [None, None], tmp_path) is None, "other settings should miss the cache"
+
+    #ensure an entry evicted by another process between the lookup and the touch is a miss
+    save_result(["Sugar", "Flour"], [None, None], np.ones((2, 2)), tmp_path)
+    def evicted(path):
+        raise FileNotFoundError(path)
+    monkeypatch.setattr(ResultCache.os, "utime", evicted)
+    assert load_result(["Sugar", "Flour"], [None, None], tmp_path) is None, "evicted entries should miss the cache"
+
+
+#tests that the oldest entries are evicted once the cache is full
+def test_result_cache_eviction(tmp_path):
+    for i in range(5):
+        save_result(["Sugar"], [i / 10], np.ones((2, 1)), tmp_path, max_entries=3)
+        os.utime(tmp_path / f"{cache_key(['Sugar'], [i / 10])}.npz", (i, i))
+
+    #ensure only the three most recently used entries are left
+    assert len(list(tmp_path.glob("*.npz"))) == 3, "cache should not grow over max_entries"
+    assert load_result(["Sugar"], [0.0], tmp_path) is None, "oldest entry should be evicted"
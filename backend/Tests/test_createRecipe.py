@@ -0,0 +1,106 @@
+import os 
+import sys 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+import queue
+import threading
+import time
+import pytest
+import backend.recipe.createRecipe as createRecipe
+from backend.recipe.createRecipe import Model, createPrompt, load_pipeline
+
+#run locally with: python -m pytest
+#theres a github workflow too
+
+#tests that recipes are generated in batches and cached by prompt
+def test_getRecipes():
+    calls = []
+    def pipeline(texts, batch_size):
+        # answers like the text2text-generation pipeline for a list of prompts
+        calls.append(list(texts))
+        return [{"generated_text": "" if "Empty" in text else f"Recipe for {text}"} for text in texts]
+    model = Model(pipeline=pipeline)
+    soup = createPrompt("Soup", ["Water", "Salt"], [0.99, 0.01])
+    cake = createPrompt("Cake", ["Flour", "Sugar"], [0.6, 0.4])
+    empty = createPrompt("Empty", ["Water"], [1])
+
+    recipes = model.getRecipes([soup, cake, soup])
+
+    #ensure the new prompts are generated once in a single batch
+    assert calls == [[soup, cake]], "new prompts should be generated together and only once"
+    assert recipes == [f"Recipe for {soup}", f"Recipe for {cake}", f"Recipe for {soup}"], "recipes should keep the order of the prompts"
+    #ensure generated recipes are served from the cache, failed ones are not cached
+    assert model.getRecipe(cake) == f"Recipe for {cake}" and len(calls) == 1, "cached prompts should not be generated again"
+    assert model.getRecipe(empty).startswith("Error") and model.getRecipe(empty).startswith("Error"), "empty output should give the error message"
+    assert len(calls) == 3, "failed generations should be tried again"
+    #ensure cached recipes are streamed at once, without generating
+    assert list(model.streamRecipe(soup)) == [f"Recipe for {soup}"], "cached recipes should be streamed as one piece"
+
+    #ensure unknown inference backends are rejected before anything is loaded
+    with pytest.raises(ValueError):
+        load_pipeline(backend="tensorrt")
+
+
+class FakeStreamer:
+    # hands the tokens from generate to the consumer like transformers.TextIteratorStreamer
+    def __init__(self, tokenizer, timeout):
+        self.tokens = queue.Queue()
+        self.timeout = timeout
+
+    def put(self, token):
+        self.tokens.put(token)
+
+    def end(self):
+        self.tokens.put(None)
+
+    def __iter__(self):
+        while True:
+            token = self.tokens.get(timeout=self.timeout)
+            if token is None:
+                return
+            yield token
+
+
+class FakeGenerator:
+    # stands in for the pipeline: tokenizer, and model.generate that streams one word at a time
+    def __init__(self, words):
+        self.words = words
+        self.generated = 0
+        self.done = threading.Event()
+        self.model = self
+        self.tokenizer = lambda prompt, return_tensors: {}
+
+    def generate(self, streamer, max_new_tokens, max_time, stopping_criteria):
+        for word in self.words[:max_new_tokens]:
+            if stopping_criteria.is_set():
+                break
+            streamer.put(word)
+            self.generated += 1
+            time.sleep(0.01)
+        streamer.end()
+        self.done.set()
+
+
+#tests that recipes are streamed while they are generated and that generation stops with the consumer
+def test_streamRecipe(monkeypatch):
+    monkeypatch.setattr(createRecipe, "create_streamer", FakeStreamer)
+    monkeypatch.setattr(createRecipe, "stop_when", lambda event: event)
+    soup = createPrompt("Soup", ["Water", "Salt"], [0.99, 0.01])
+    cake = createPrompt("Cake", ["Flour", "Sugar"], [0.6, 0.4])
+
+    generator = FakeGenerator(["Boil ", "the ", "water."])
+    model = Model(pipeline=generator)
+    parts = list(model.streamRecipe(soup, max_time=5))
+
+    #ensure the text so far is yielded for every token and the finished recipe is cached
+    assert parts == ["Boil ", "Boil the ", "Boil the water."], "every token should extend the streamed text"
+    assert list(model.streamRecipe(soup)) == ["Boil the water."], "finished recipes should be cached"
+
+    generator = FakeGenerator(["word "] * 1000)
+    model = Model(pipeline=generator)
+    stream = model.streamRecipe(cake, max_time=5)
+    next(stream)
+    stream.close()
+
+    #ensure generate stops once the consumer stops iterating, and the cut off text is not cached
+    assert generator.done.wait(5) and generator.generated < 1000, "generation should stop with the consumer"
+    assert cake not in model.cache, "cut off recipes should not be cached"
@@ -1,26 +1,179 @@
-import transformers
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
 import numpy as np
 
+# The model is loaded once per process on first use (get_model), not per browser session.
+# Generated recipes are cached by prompt, and prompts that are requested together are generated
+# in one batched call of the pipeline.
+# The inference backend is chosen when the model is loaded: "pytorch" (the plain pipeline), "int8"
+# (dynamic int8 quantization of the linear layers) or "onnx" (ONNX Runtime through optimum).
+# With a model_path the model is loaded from that directory only, without network access.
+# get_model uses RECIPE_BACKEND and RECIPE_MODEL_PATH from the environment.
+
+MODEL_ID = "MettBrot/flan-t5-small-quaso-gen3"
+BACKENDS = ("pytorch", "int8", "onnx")
+BACKEND = os.environ.get("RECIPE_BACKEND", "pytorch")
+MODEL_PATH = os.environ.get("RECIPE_MODEL_PATH")
+BATCH_SIZE = 8
+CACHE_SIZE = 256
+# budget of streamRecipe: at most MAX_NEW_TOKENS tokens and STREAM_TIMEOUT seconds
+MAX_NEW_TOKENS = 256
+STREAM_TIMEOUT = 30.0
+ERROR_MESSAGE = "Error: Couldnt generate recipe. Please try again."
+
+
+def load_pipeline(model_id=MODEL_ID, backend="pytorch", model_path=None):
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown backend {backend!r}, expected one of {BACKENDS}")
+    # transformers and torch take seconds to import, so only when a model is really needed
+    import transformers
+
+    source = model_path or model_id
+    local = model_path is not None
+    tokenizer = transformers.AutoTokenizer.from_pretrained(source, local_files_only=local)
+    if backend == "onnx":
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+        # a directory exported with optimum-cli is loaded as is, a PyTorch checkpoint is exported on the fly
+        exported = local and any(Path(model_path).glob("*.onnx"))
+        model = ORTModelForSeq2SeqLM.from_pretrained(source, local_files_only=local, export=not exported)
+    else:
+        model = transformers.AutoModelForSeq2SeqLM.from_pretrained(source, local_files_only=local)
+        if backend == "int8":
+            import torch
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return transformers.pipeline("text2text-generation", model=model, tokenizer=tokenizer)
+
 
 class Model:
-    def __init__(self):
-        model_id = "MettBrot/flan-t5-small-quaso-gen3"
-        self.model = transformers.pipeline("text2text-generation", model=model_id, tokenizer=model_id)
+    def __init__(self, model_id=MODEL_ID, pipeline=None, backend="pytorch", model_path=None):
+        # pipeline: an already loaded text2text-generation pipeline (or any callable like it)
+        if pipeline is None:
+            pipeline = load_pipeline(model_id, backend, model_path)
+        self.model = pipeline
+        self.backend = backend
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __createRecipes(self, texts):
+        return self.model(texts, batch_size=BATCH_SIZE)
+
+    def getRecipes(self, prompts):
+        with self.lock:
+            missing = list(dict.fromkeys(prompt for prompt in prompts if prompt not in self.cache))
+            for prompt in self.cache.keys() & set(prompts):
+                self.cache.move_to_end(prompt)
+            recipes = {prompt: self.cache[prompt] for prompt in prompts if prompt in self.cache}
+
+        if missing:
+            outputs = self.__createRecipes(missing)
+            for prompt, output in zip(missing, outputs):
+                # a single prompt gives [{...}], a list of prompts one dict per prompt
+                output = output[0] if isinstance(output, list) else output
+                output = cleanRecipe(output['generated_text'])
+                recipes[prompt] = output if output else ERROR_MESSAGE
+
+            for prompt in missing:
+                # failed generations are not cached, so trying again can still succeed
+                if recipes[prompt] != ERROR_MESSAGE:
+                    self.store(prompt, recipes[prompt])
+
+        return [recipes[prompt] for prompt in prompts]
 
-    def __createRecipe(self, text):
-        return self.model(text)
-    
     def getRecipe(self, prompt):
-            output = self.__createRecipe(prompt)[0]['generated_text']
-            output = output.replace('u00b0', '°f').replace('u00b', '°f')
-            if output == None or output == "":
-                return "Error: Couldnt generate recipe. Please try again."
-            return output
-    
+            return self.getRecipes([prompt])[0]
+
+    def store(self, prompt, recipe):
+        with self.lock:
+            self.cache[prompt] = recipe
+            while len(self.cache) > CACHE_SIZE:
+                self.cache.popitem(last=False)
+
+    def streamRecipe(self, prompt, max_new_tokens=MAX_NEW_TOKENS, max_time=STREAM_TIMEOUT):
+        # yields the recipe text so far every time new tokens are generated, so the UI can show it
+        # while the rest is still generated. Stops after max_new_tokens tokens or max_time seconds.
+        with self.lock:
+            cached = self.cache.get(prompt)
+            if cached is not None:
+                self.cache.move_to_end(prompt)
+        if cached is not None:
+            yield cached
+            return
+
+        tokenizer = self.model.tokenizer
+        streamer = create_streamer(tokenizer, max_time)
+        inputs = tokenizer(prompt, return_tensors="pt")
+        # generate runs in the background and hands the decoded tokens over through the streamer,
+        # it stops early once stop is set
+        stop = threading.Event()
+        thread = threading.Thread(
+            target=self.model.model.generate,
+            kwargs=dict(**inputs, streamer=streamer, max_new_tokens=max_new_tokens, max_time=max_time, stopping_criteria=stop_when(stop)),
+            daemon=True,
+        )
+        start = time.perf_counter()
+        thread.start()
+
+        text = ""
+        try:
+            for token in streamer:
+                text += token
+                yield cleanRecipe(text)
+        except queue.Empty:
+            # no new token within max_time, the generation is stuck or failed
+            pass
+        finally:
+            # also when the caller stops iterating (e.g. the output was removed from the page),
+            # so generate does not keep the model busy until max_new_tokens or max_time
+            stop.set()
+
+        text = cleanRecipe(text)
+        if not text:
+            yield ERROR_MESSAGE
+        elif time.perf_counter() - start < max_time:
+            # recipes cut off by the time budget are not cached
+            self.store(prompt, text)
+
+
+def create_streamer(tokenizer, timeout):
+    from transformers import TextIteratorStreamer
+    return TextIteratorStreamer(tokenizer, skip_special_tokens=True, timeout=timeout)
+
+
+def stop_when(event):
+    # stopping criteria for generate, which checks them after every token
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class EventSet(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return event.is_set()
+
+    return StoppingCriteriaList([EventSet()])
+
+
+def cleanRecipe(text):
+    return text.replace('u00b0', '°f').replace('u00b', '°f')
+
+
+_model = None
+_model_lock = threading.Lock()
+
+def get_model():
+    # one model per process, shared by all sessions and threads
+    global _model
+    with _model_lock:
+        if _model is None:
+            _model = Model(backend=BACKEND, model_path=MODEL_PATH)
+    return _model
+
+
 def createPrompt(recipeName, ingredients, meanOfSamples):
     prompt = f"Create a detailed recipe for: Title {recipeName} Ingredients: "
     meanOfSamples = np.round(meanOfSamples, 2)
     for i, ingredient in enumerate(ingredients):
         prompt += f"{ingredient}, " if i != len(ingredients) - 1 else f" {ingredient}."
         # {meanOfSamples[i]}
-    return prompt
\ No newline at end of file
+    return prompt
@@ -0,0 +1,59 @@
+import os
+import sys
+import timeit
+import warnings
+import numpy as np
+from scipy.optimize import linprog
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.Input import constraintMatrices
+from backend.MainCode import ordered_interior_point, chebyshev_center
+
+# Compares the constructed initial point with the linear programs for the constraints of createMatrices
+# run with: python benchmarks/bench_initial_point.py
+
+
+def label(D, num_fixed):
+    # a decreasing label with num_fixed amounts given at evenly spaced positions
+    amounts = np.linspace(2, 1, D)
+    amounts /= amounts.sum()
+    fixed = tuple(i in np.linspace(0, D - 1, num_fixed).astype(int) for i in range(D)) if num_fixed else (False,) * D
+    A, a, B = constraintMatrices(D, fixed)
+    b = np.zeros(B.shape[0])
+    b[0] = 1
+    n = B.shape[0]
+    for i in range(D):
+        if fixed[i]:
+            b[n - 1] = amounts[i]
+            n -= 1
+    return A, a, B, b
+
+
+def interior_point(A, a, B, b):
+    # the solver MainCode used before, not available in newer SciPy versions
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", category=DeprecationWarning)
+        return linprog(np.ones(A.shape[1]), A_ub=A, b_ub=a, A_eq=B, b_eq=b, method="interior-point").x
+
+
+def best_time(function, args, number):
+    return min(timeit.repeat(lambda: function(*args), number=number, repeat=5)) / number
+
+
+def main():
+    methods = {"constructive": ordered_interior_point, "highs": chebyshev_center, "interior-point": interior_point}
+    print(f"{'D':>4} {'fixed':>6} " + " ".join(f"{name:>16}" for name in methods))
+    for D in (3, 5, 10, 20, 50):
+        for num_fixed in (0, 2, D // 2):
+            args = label(D, num_fixed)
+            times = []
+            for function in methods.values():
+                try:
+                    times.append(f"{best_time(function, args, 20) * 1e6:14.1f}us")
+                except ValueError:
+                    times.append(f"{'n/a':>16}")  # method not available in this SciPy version
+            print(f"{D:>4} {num_fixed:>6} " + " ".join(times))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import backend.recipe.createRecipe as createRecipe
+
+# Compares the inference backends of the recipe model: load time, latency per recipe, peak memory
+# and whether the recipes are the same as the ones of the plain PyTorch pipeline.
+# Every backend runs in its own process, so the peak memory of one does not hide the others.
+# run with: python benchmarks/bench_recipe_model.py --model-path path/to/flan-t5-small-quaso-gen3
+
+RECIPES = [
+    ("Pesto", ["Basil", "Olive oil", "Parmesan", "Pine nuts", "Salt"], [0.4, 0.3, 0.17, 0.1, 0.03]),
+    ("Tomato soup", ["Tomatoes", "Water", "Onions", "Cream", "Salt"], [0.6, 0.2, 0.1, 0.08, 0.02]),
+    ("Hazelnut spread", ["Sugar", "Palm oil", "Hazelnuts", "Cocoa", "Milk powder"], [0.5, 0.2, 0.13, 0.1, 0.07]),
+    ("Lentil stew", ["Cooked lentils", "Water", "Carrots", "Onions", "Salt"], [0.63, 0.2, 0.1, 0.05, 0.02]),
+]
+
+
+def run_backend(backend, model_path, repeat):
+    # runs in the child process, prints the measurements as JSON
+    prompts = [createRecipe.createPrompt(*recipe) for recipe in RECIPES]
+    start = time.perf_counter()
+    pipeline = createRecipe.load_pipeline(backend=backend, model_path=model_path)
+    load_seconds = time.perf_counter() - start
+
+    latencies = []
+    for _ in range(repeat):
+        for prompt in prompts:
+            start = time.perf_counter()
+            pipeline([prompt])
+            latencies.append(time.perf_counter() - start)
+    outputs = [output[0] if isinstance(output, list) else output for output in pipeline(prompts)]
+
+    latencies.sort()
+    print(json.dumps({
+        "backend": backend,
+        "load_seconds": load_seconds,
+        "median_seconds": latencies[len(latencies) // 2],
+        # ru_maxrss is in kB on Linux
+        "peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "recipes": [output["generated_text"] for output in outputs],
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the inference backends of the recipe model.")
+    parser.add_argument("--model-path", default=None, help="local directory of the model (default: download MODEL_ID)")
+    parser.add_argument("--backends", nargs="+", default=list(createRecipe.BACKENDS), choices=createRecipe.BACKENDS)
+    parser.add_argument("--repeat", type=int, default=3, help="generations per prompt")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        run_backend(args.child, args.model_path, args.repeat)
+        return
+
+    results = {}
+    for backend in args.backends:
+        command = [sys.executable, __file__, "--child", backend, "--repeat", str(args.repeat)]
+        if args.model_path is not None:
+            command += ["--model-path", args.model_path]
+        process = subprocess.run(command, capture_output=True, text=True)
+        if process.returncode != 0:
+            # e.g. optimum or onnxruntime not installed
+            print(f"{backend}: failed\n{process.stderr.strip().splitlines()[-1] if process.stderr.strip() else ''}", file=sys.stderr)
+            continue
+        results[backend] = json.loads(process.stdout.strip().splitlines()[-1])
+
+    reference = results.get("pytorch", {}).get("recipes")
+    print(f"{'backend':>8} {'load':>8} {'latency':>9} {'peak':>9} {'same output':>12}")
+    for backend, result in results.items():
+        same = "n/a" if reference is None else f"{sum(a == b for a, b in zip(result['recipes'], reference))}/{len(reference)}"
+        print(f"{backend:>8} {result['load_seconds']:7.2f}s {result['median_seconds'] * 1000:7.0f}ms {result['peak_mb']:7.0f}MB {same:>12}")
+
+
+if __name__ == "__main__":
+    main()
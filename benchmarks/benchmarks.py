@@ -0,0 +1,130 @@
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import backend.Input as Input
+import backend.MainCode as MainCode
+
+# Benchmarks of the estimation pipeline in the layout of asv (airspeed velocity): every class is a group,
+# params/param_names span the cases, and the method prefix says what is measured:
+#   time_*     wall time
+#   peakmem_*  peak memory of the call
+#   track_*    the returned number (here effective samples per second, higher is better)
+# run with: python benchmarks/run_benchmarks.py (see there for saving and comparing results)
+
+DIMENSIONS = [3, 5, 10, 20, 50]
+FIXED = [0.0, 0.25, 0.5]  # fraction of the amounts that are given
+NUM_ITER = 2000
+ESS_ITER = 20000  # longer chains, the ESS of a few samples is too noisy to compare
+THINNING = 20
+
+
+def label(D, fixed_fraction):
+    # a decreasing label where every few amounts are given, and its constraints as built by createMatrices
+    amounts = np.linspace(2, 1, D)
+    amounts /= amounts.sum()
+    num_fixed = int(round(fixed_fraction * D))
+    positions = set(np.linspace(0, D - 1, num_fixed).astype(int)) if num_fixed else set()
+    givenAmounts = [float(amounts[i]) if i in positions else None for i in range(D)]
+    return (givenAmounts, *Input.labelConstraints(givenAmounts))
+
+
+def sampled_label(D, fixed_fraction):
+    # like label, but skips the case (asv convention) if at most one amount is unknown:
+    # then the polytope is a single point and there is nothing to sample
+    givenAmounts, A, a, B, b = label(D, fixed_fraction)
+    if givenAmounts.count(None) < 2:
+        raise NotImplementedError("the amounts are determined by the label")
+    return givenAmounts, A, a, B, b
+
+
+class InitialPoint:
+    params = (DIMENSIONS, FIXED)
+    param_names = ["D", "fixed"]
+
+    def setup(self, D, fixed):
+        _, self.A, self.a, self.B, self.b = sampled_label(D, fixed)
+
+    def time_find_initial_point(self, D, fixed):
+        MainCode.find_initial_point(self.A, self.a, self.B, self.b)
+
+    def time_chebyshev_center(self, D, fixed):
+        MainCode.chebyshev_center(self.A, self.a, self.B, self.b)
+
+
+class Directions:
+    params = (DIMENSIONS, FIXED)
+    param_names = ["D", "fixed"]
+
+    def setup(self, D, fixed):
+        _, _, _, self.B, _ = label(D, fixed)
+
+    def time_construct_directions(self, D, fixed):
+        # without the cache, so the SVD is part of the time
+        MainCode._null_space_basis.cache_clear()
+        MainCode.construct_directions(self.B)
+
+    def time_construct_directions_cached(self, D, fixed):
+        MainCode.construct_directions(self.B)
+
+
+class Step:
+    params = (DIMENSIONS, FIXED)
+    param_names = ["D", "fixed"]
+
+    def setup(self, D, fixed):
+        _, self.A, self.a, self.B, self.b = sampled_label(D, fixed)
+        self.x0 = MainCode.find_initial_point(self.A, self.a, self.B, self.b)
+        self.direction = MainCode.construct_directions(self.B)(np.random.default_rng(0))
+        self.rng = np.random.default_rng(0)
+
+    def time_project_and_sample(self, D, fixed):
+        MainCode.project_and_sample(self.x0, self.direction, self.A, self.a, self.rng)
+
+
+class Sampler:
+    params = (DIMENSIONS, [0.0, 0.5], sorted(MainCode.SAMPLERS))
+    param_names = ["D", "fixed", "backend"]
+
+    def setup(self, D, fixed, backend):
+        if backend == "numba" and MainCode.numba_kernel() is None:
+            # the numba backend would measure its NumPy fallback
+            raise NotImplementedError("numba is not installed")
+        _, self.A, self.a, self.B, self.b = sampled_label(D, fixed)
+        self.x0 = MainCode.find_initial_point(self.A, self.a, self.B, self.b)
+        self.sampler = MainCode.get_sampler(backend)
+
+    def run(self, D, num_iter=NUM_ITER):
+        return self.sampler(D, self.A, self.a, self.B, self.b, num_iter=num_iter, thinning=THINNING, x0=self.x0, rng=np.random.default_rng(0))
+
+    def time_MCMC(self, D, fixed, backend):
+        self.run(D)
+
+    def peakmem_MCMC(self, D, fixed, backend):
+        self.run(D)
+
+    def track_ess_per_second(self, D, fixed, backend):
+        # effective samples of the worst mixing amount per second of sampling, the given amounts always count all samples
+        start = time.perf_counter()
+        samples = self.run(D, ESS_ITER)
+        seconds = time.perf_counter() - start
+        free = ~MainCode.constant_columns(samples)
+        return float(np.min(MainCode.effective_sample_size(samples)[free])) / seconds
+    track_ess_per_second.unit = "samples/s"
+
+
+class CreateMatrices:
+    params = (DIMENSIONS, FIXED)
+    param_names = ["D", "fixed"]
+
+    def setup(self, D, fixed):
+        self.givenAmounts, _, _, _, _ = label(D, fixed)
+        self.ingredients = [f"Ingredient {i}" for i in range(D)]
+
+    def time_createMatrices(self, D, fixed):
+        Input.createMatrices(self.ingredients, self.givenAmounts, None)
+
+    def peakmem_createMatrices(self, D, fixed):
+        Input.createMatrices(self.ingredients, self.givenAmounts, None)
@@ -0,0 +1,135 @@
+import argparse
+import inspect
+import itertools
+import json
+import re
+import sys
+import time
+import tracemalloc
+
+import benchmarks
+
+# Small runner for the asv-style benchmarks in benchmarks.py, so no extra tool is needed:
+#
+#   python benchmarks/run_benchmarks.py --save results.json
+#   python benchmarks/run_benchmarks.py --compare results.json --threshold 1.2 --filter Sampler
+#
+# Every case is run in this process after one warm-up call: time_* as the best of a few repeats
+# (more for fast cases), peakmem_* with tracemalloc, track_* once. --compare reports every case
+# that got slower, uses more memory or tracks a lower value than the saved results by more than
+# the threshold factor, and exits with 1 if there is one, so it can run before a deployment.
+
+PREFIXES = ("time_", "peakmem_", "track_")
+MIN_SECONDS = 0.2  # time spent per time_* case
+MIN_REPEAT = 2
+MAX_REPEAT = 50
+
+
+def cases(pattern=None):
+    # (name, group class, method name, params) for every benchmark case
+    for _, group in inspect.getmembers(benchmarks, inspect.isclass):
+        if group.__module__ != benchmarks.__name__:
+            continue
+        params = getattr(group, "params", ())
+        param_names = getattr(group, "param_names", [])
+        for method in sorted(name for name in dir(group) if name.startswith(PREFIXES)):
+            for values in itertools.product(*params):
+                name = f"{group.__name__}.{method}(" + ", ".join(f"{key}={value}" for key, value in zip(param_names, values)) + ")"
+                if pattern is None or re.search(pattern, name):
+                    yield name, group, method, values
+
+
+def measure(group, method, values):
+    instance = group()
+    if hasattr(instance, "setup"):
+        instance.setup(*values)
+    function = getattr(instance, method)
+
+    if method.startswith("track_"):
+        return function(*values)
+
+    # one call first, so imports and caches filled on first use are not measured
+    function(*values)
+
+    if method.startswith("peakmem_"):
+        tracemalloc.start()
+        try:
+            function(*values)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    # the best of the repeats is reported, fast cases are repeated more often
+    start = time.perf_counter()
+    function(*values)
+    best = time.perf_counter() - start
+    for _ in range(min(max(int(MIN_SECONDS / max(best, 1e-9)), MIN_REPEAT), MAX_REPEAT)):
+        start = time.perf_counter()
+        function(*values)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def format_value(method, value):
+    if method.startswith("time_"):
+        return f"{value * 1e3:10.3f} ms"
+    if method.startswith("peakmem_"):
+        return f"{value / 1024:10.1f} kB"
+    return f"{value:10.1f}"
+
+
+def regression(method, value, baseline, threshold):
+    # time and memory should not grow, tracked values (ESS/s) should not drop
+    if method.startswith("track_"):
+        return value * threshold < baseline
+    return value > baseline * threshold
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the benchmarks of the estimation pipeline.")
+    parser.add_argument("--filter", default=None, help="regular expression, only matching cases are run")
+    parser.add_argument("--save", default=None, help="write the results to this JSON file")
+    parser.add_argument("--compare", default=None, help="JSON file of earlier results to check for regressions")
+    parser.add_argument("--threshold", type=float, default=1.2, help="factor that counts as a regression")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.compare is not None:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)["results"]
+
+    results = {}
+    regressions = []
+    for name, group, method, values in cases(args.filter):
+        try:
+            value = measure(group, method, values)
+        except NotImplementedError:
+            # raised by setup for cases that do not apply, like in asv
+            print(f"{name:<70} skipped")
+            continue
+        except Exception as error:
+            # e.g. a solver that is not available, the other cases still run
+            print(f"{name:<70} failed: {error}")
+            continue
+        results[name] = value
+        line = f"{name:<70} {format_value(method, value)}"
+        if name in baseline:
+            ratio = value / baseline[name] if baseline[name] else float("inf")
+            line += f"  ({ratio:5.2f}x)"
+            if regression(method, value, baseline[name], args.threshold):
+                regressions.append(name)
+                line += "  REGRESSION"
+        print(line, flush=True)
+
+    if args.save is not None:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump({"created": time.time(), "python": sys.version, "results": results}, file, indent=1)
+
+    if regressions:
+        print(f"\n{len(regressions)} regressions against {args.compare}:", *regressions, sep="\n  ")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,28 +1,130 @@
-import pandas as pd
+import csv
+import sqlite3
+import time
+from contextlib import closing
 from pathlib import Path
 import numpy as np
+import pandas as pd
+from backend.Input import NUTRIENTS
+
+# History of the saved estimates in a SQLite database: one row per recipe (name, nutritional values,
+# number of samples) and one row per ingredient (name, given amount and the mean/std of the samples),
+# so there is no limit on the number of ingredients. Recipes are indexed by name, and many entries
+# are written in a single transaction with save_many.
+# The old ingredients.csv (20 ingredient columns, the nutritional values and the recipe name) can be
+# imported with import_csv.
+
+DATABASE_PATH = Path(__file__).parent / "history.sqlite"
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS recipes (
+    id INTEGER PRIMARY KEY,
+    recipe TEXT NOT NULL,
+    created REAL NOT NULL,
+    num_samples INTEGER,
+    {", ".join(f"{column} REAL" for column in NUTRIENTS)}
+);
+CREATE INDEX IF NOT EXISTS recipes_by_name ON recipes (recipe);
+CREATE TABLE IF NOT EXISTS ingredients (
+    recipe_id INTEGER NOT NULL REFERENCES recipes (id),
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    amount REAL,
+    mean REAL,
+    std REAL,
+    PRIMARY KEY (recipe_id, position)
+) WITHOUT ROWID;
+"""
+
+
+def connect(path=DATABASE_PATH):
+    connection = sqlite3.connect(path)
+    # WAL lets the UI read the history while a batch job writes to it
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def entry(Ingredients, Nutrients, Recipe, givenAmounts=None, samples=None):
+    # one estimate as saved by save_many, the summary of the samples is stored instead of the samples
+    item = {
+        "recipe": Recipe,
+        "ingredients": list(Ingredients),
+        "amounts": list(givenAmounts) if givenAmounts is not None else [None] * len(Ingredients),
+        "nutrients": list(Nutrients) if Nutrients is not None else [None] * len(NUTRIENTS),
+        "mean": None,
+        "std": None,
+        "num_samples": None,
+    }
+    if samples is not None:
+        samples = np.atleast_2d(samples)
+        item.update(mean=np.mean(samples, axis=0).tolist(), std=np.std(samples, axis=0).tolist(), num_samples=len(samples))
+    return item
+
+
+def save_many(entries, path=DATABASE_PATH):
+    # all entries in one transaction: a crash never leaves half an entry, and the disk is synced once
+    created = time.time()
+    with closing(connect(path)) as connection, connection:
+        for item in entries:
+            cursor = connection.execute(
+                f"INSERT INTO recipes (recipe, created, num_samples, {', '.join(NUTRIENTS)}) VALUES (?, ?, ?{', ?' * len(NUTRIENTS)})",
+                [item["recipe"], created, item.get("num_samples"), *item["nutrients"]],
+            )
+            mean = item.get("mean") or [None] * len(item["ingredients"])
+            std = item.get("std") or [None] * len(item["ingredients"])
+            connection.executemany(
+                "INSERT INTO ingredients (recipe_id, position, name, amount, mean, std) VALUES (?, ?, ?, ?, ?, ?)",
+                [(cursor.lastrowid, position, *values) for position, values in enumerate(zip(item["ingredients"], item["amounts"], mean, std))],
+            )
+
 
-# Save the data to the csv file
-# Ingredients cant be more than 20 
-# First 20 columns are the ingredients and the last 6 columns are the nutritional values and last column is the recipe name
-
-def save_data(Ingredients, Nutrients, Recipe):
-    path = Path("data/ingredients.csv")
-    if not path.exists():
-        df = pd.DataFrame(columns=['1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12', '13', '14', '15', '16', '17', '18', '19', '20', 'carbs', 'fat', 'protein', 'salt', 'fiber', 'sugar', 'recipe'])
-        df.to_csv(path, index=False)
-    for i in range(20 - len(Ingredients)):
-        Ingredients.append(None)
-    Ingredients.extend(Nutrients)
-    Ingredients.append(Recipe)
-    Ingredients = np.array([Ingredients])
-    Ingredients.T
-    df = pd.DataFrame(Ingredients)
-    df.to_csv(path, mode = 'a', index=False, header=False)
-
-def load_data():
-    path = Path("data/ingredients.csv")
-    if not path.exists():
+# Save the data to the history
+def save_data(Ingredients, Nutrients, Recipe, givenAmounts=None, samples=None, path=DATABASE_PATH):
+    save_many([entry(Ingredients, Nutrients, Recipe, givenAmounts, samples)], path)
+
+
+def _read(path, where="", parameters=()):
+    if not Path(path).exists():
         return None
-    df = pd.read_csv(path)
-    return df
\ No newline at end of file
+    with closing(connect(path)) as connection:
+        return pd.read_sql_query(
+            f"SELECT r.id, r.recipe, r.created, r.num_samples, {', '.join('r.' + column for column in NUTRIENTS)}, "
+            "i.position, i.name, i.amount, i.mean, i.std "
+            f"FROM recipes r JOIN ingredients i ON i.recipe_id = r.id {where} ORDER BY r.id, i.position",
+            connection,
+            params=parameters,
+        )
+
+
+# all saved estimates, one row per ingredient
+def load_data(path=DATABASE_PATH):
+    return _read(path)
+
+
+# the saved estimates of one recipe, looked up through the name index
+def find_recipe(Recipe, path=DATABASE_PATH):
+    return _read(path, "WHERE r.recipe = ?", (Recipe,))
+
+
+def fraction(value):
+    # the CSV files are in % (g per 100 g), the history in fractions like the amounts (see NutrientDatabase.read_database)
+    if value is None or str(value).strip() == "":
+        return None
+    return float(value) / 100
+
+
+def import_csv(csv_path, path=DATABASE_PATH):
+    # imports a file in the old layout of ingredients.csv, ingredient cells are "name" or "name:amount"
+    entries = []
+    with open(csv_path, newline="", encoding="utf-8") as file:
+        for row in csv.DictReader(file):
+            columns = sorted((column for column in row if column and column.isdigit()), key=int)
+            cells = [row[column].partition(":") for column in columns if row[column] not in (None, "")]
+            Ingredients = [name.strip() for name, _, _ in cells]
+            givenAmounts = [fraction(amount) for _, _, amount in cells]
+            Nutrients = [fraction(row.get(column)) for column in NUTRIENTS]
+            entries.append(entry(Ingredients, Nutrients, row.get("recipe", ""), givenAmounts))
+    save_many(entries, path)
+    return len(entries)
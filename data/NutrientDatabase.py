@@ -0,0 +1,100 @@
+import csv
+import difflib
+import re
+import unicodedata
+from functools import lru_cache
+from pathlib import Path
+import numpy as np
+from backend.Input import NUTRIENTS
+
+# Nutrient profiles of single ingredients, used as the nutrient table of Input.createMatrices.
+# The profiles are read from nutrients.csv (g per 100 g, columns in the order of Input.NUTRIENTS, "|"-separated
+# aliases e.g. for the German names) once per process into a read-only array with a dict index of the
+# normalized names. Forked workers (BatchInput.py) inherit the loaded database.
+# Names that are not in the index are matched fuzzily, the result of every lookup is cached.
+
+DATABASE_PATH = Path(__file__).parent / "nutrients.csv"
+FUZZY_CUTOFF = 0.85
+FUZZY_CACHE_SIZE = 4096
+
+
+def normalize(name):
+    # "  Gek. Linsen (35%)" -> "gek linsen": no case, accents, amounts in brackets or punctuation
+    name = re.sub(r"\(.*?\)|\[.*?\]", " ", str(name).casefold())
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(char for char in name if not unicodedata.combining(char))
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", name).split())
+
+
+class NutrientDatabase:
+    def __init__(self, names, table):
+        self.names = list(names)
+        # fractions like the amounts, shared by all lookups, so it must not be changed
+        self.table = np.asarray(table, dtype=float) / 100
+        self.table.flags.writeable = False
+        self.index = {}
+        # results of _fuzzy_lookup, per database so the cache does not keep databases alive
+        self.fuzzy_matches = {}
+
+
+    def add_name(self, name, row):
+        # the first entry wins, so aliases cannot shadow the name of another ingredient
+        self.index.setdefault(normalize(name), row)
+
+
+    def lookup(self, name):
+        # row of the ingredient or None if it is not known
+        key = normalize(name)
+        row = self.index.get(key)
+        if row is None:
+            row = self._fuzzy_lookup(key)
+        return row
+
+
+    def _fuzzy_lookup(self, key):
+        # misspellings and plurals, e.g. "hazelnut" or "Haselnusse"
+        if key not in self.fuzzy_matches:
+            if len(self.fuzzy_matches) >= FUZZY_CACHE_SIZE:
+                self.fuzzy_matches.clear()
+            match = difflib.get_close_matches(key, self.index.keys(), n=1, cutoff=FUZZY_CUTOFF)
+            self.fuzzy_matches[key] = self.index[match[0]] if match else None
+        return self.fuzzy_matches[key]
+
+
+    def nutrients(self, name):
+        row = self.lookup(name)
+        return None if row is None else self.table[row]
+
+
+    def nutrient_table(self, Ingredients):
+        # one row per ingredient, None for unknown ingredients (see Input.nutrientConstraints)
+        return [self.nutrients(name) for name in Ingredients]
+
+
+def read_database(path):
+    names = []
+    rows = []
+    aliases = []
+    with open(path, newline="", encoding="utf-8") as file:
+        for record in csv.DictReader(file):
+            names.append(record["name"])
+            aliases.append([alias for alias in (record.get("aliases") or "").split("|") if alias.strip()])
+            rows.append([float(record[column] or "nan") for column in NUTRIENTS])
+
+    database = NutrientDatabase(names, np.array(rows).reshape(-1, len(NUTRIENTS)))
+    for row, name in enumerate(names):
+        database.add_name(name, row)
+    for row, names in enumerate(aliases):
+        for name in names:
+            database.add_name(name, row)
+    return database
+
+
+@lru_cache(maxsize=None)
+def load_database(path=DATABASE_PATH):
+    # one database per process and file
+    return read_database(path)
+
+
+def nutrient_table(Ingredients, path=DATABASE_PATH):
+    return load_database(path).nutrient_table(Ingredients)
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+import numpy as np
+import backend.Input as Input
+import backend.MainCode as MainCode
+import data.NutrientDatabase as NutrientDatabase
+
+# Persistent cache of finished estimates, so resubmitting the same label skips the MCMC run.
+# Every entry is one .npz file (mean, std and the thinned samples) named after the hash of the query
+# and of the settings the samples depend on (see settings).
+# The least recently used entries are deleted once the cache grows over MAX_ENTRIES or MAX_BYTES.
+
+CACHE_DIR = Path(__file__).parent / "result_cache"
+MAX_ENTRIES = 1000
+MAX_BYTES = 200 * 1024 * 1024
+# bump when a change of the sampler or of the constraints changes the results
+CACHE_VERSION = 2
+
+
+def settings():
+    # everything besides the query that changes the samples: the sampler backend, the nutrient tolerances
+    # and the nutrient database (by size and modification time), so changing one of them is a cache miss
+    try:
+        stat = NutrientDatabase.DATABASE_PATH.stat()
+        database = [stat.st_size, stat.st_mtime_ns]
+    except FileNotFoundError:
+        database = None
+    return [CACHE_VERSION, MainCode.DEFAULT_SAMPLER, Input.NUTRIENT_RELATIVE_TOLERANCE, Input.NUTRIENT_ABSOLUTE_TOLERANCE, database]
+
+
+def cache_key(Ingredients, givenAmounts, Nutrients=None):
+    # canonical form: names without surrounding whitespace and case, amounts as rounded floats
+    names = [str(name).strip().casefold() for name in Ingredients]
+    amounts = [None if amount is None else round(float(amount), 12) for amount in givenAmounts]
+    nutrients = [None if value is None else round(float(value), 12) for value in Nutrients or []]
+    canonical = json.dumps([names, amounts, nutrients, settings()], separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def load_result(Ingredients, givenAmounts, cache_dir=CACHE_DIR, Nutrients=None):
+    path = Path(cache_dir) / f"{cache_key(Ingredients, givenAmounts, Nutrients)}.npz"
+    if not path.exists():
+        return None
+    try:
+        with np.load(path) as data:
+            result = {name: data[name] for name in ("mean", "std", "samples")}
+    except (OSError, ValueError, KeyError):
+        # broken entry (e.g. interrupted write), drop it and compute again
+        path.unlink(missing_ok=True)
+        return None
+
+    # mark as recently used for the eviction
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return None  # evicted by another process in the meantime
+    return result
+
+
+def save_result(Ingredients, givenAmounts, samples, cache_dir=CACHE_DIR, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES, Nutrients=None):
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    samples = np.asarray(samples, dtype=float)
+    path = cache_dir / f"{cache_key(Ingredients, givenAmounts, Nutrients)}.npz"
+
+    # write to a temporary file first, so readers never see a half written entry
+    temp_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp")
+    with open(temp_path, "wb") as file:
+        np.savez(file, mean=np.mean(samples, axis=0), std=np.std(samples, axis=0), samples=samples)
+    os.replace(temp_path, path)
+
+    evict(cache_dir, max_entries, max_bytes)
+
+
+def evict(cache_dir=CACHE_DIR, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+    entries = []
+    for path in Path(cache_dir).glob("*.npz"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue  # removed by another process in the meantime
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    # newest first, everything after the limits is removed
+    entries.sort(key=lambda entry: entry[0], reverse=True)
+    total = 0
+    for count, (_, size, path) in enumerate(entries, start=1):
+        total += size
+        if count > max_entries or total > max_bytes:
+            path.unlink(missing_ok=True)
+
+
+def clear(cache_dir=CACHE_DIR):
+    for path in Path(cache_dir).glob("*.npz"):
+        path.unlink(missing_ok=True)